@@ -0,0 +1,99 @@
+"""
+Measures CLI startup with `python -X importtime` and fails if it regresses.
+
+Each scenario runs in a fresh interpreter. It fails if a module that its code path
+should not load gets imported, or if the total import time (best of --repeat runs)
+exceeds its budget. Budgets can be scaled for slower machines with --budget-scale.
+
+    python -m benchmarks.bench_import
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import List, NamedTuple, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["pandas", "numpy", "matplotlib", "google.cloud.monitoring_v3"]
+
+class Scenario(NamedTuple):
+    name: str
+    args: List[str]
+    forbidden: List[str]
+    budget_ms: float
+
+SCENARIOS = [
+    Scenario("--help", ["-m", "monitor.main", "--help"], HEAVY_MODULES, 400),
+    Scenario("argument error", ["-m", "monitor.main", "--project-id", "p"], HEAVY_MODULES, 400),
+    # The modules a plain `--metric --output csv` run loads; charting is not among them.
+    Scenario(
+        "query path",
+        ["-c", "import monitor.main, monitor.gcp_client, monitor.cache, monitor.histograms"],
+        ["matplotlib"],
+        1500,
+    ),
+]
+
+def import_times(args: List[str]) -> List[Tuple[str, int, bool]]:
+    """
+    Runs a fresh interpreter with -X importtime and returns (module, cumulative
+    microseconds, is top-level) for every import, in the order they finished.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime"] + args,
+        cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True,
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name_field = line[len("import time:"):].split("|")
+        # Nested imports are indented by two spaces per level under their parent.
+        imports.append((name_field.strip(), int(cumulative), not name_field.startswith("  ")))
+    return imports
+
+def run_scenario(scenario: Scenario, repeat: int, budget_scale: float) -> List[str]:
+    """
+    Runs one scenario and returns its failures (empty if it passed).
+    """
+    runs = [import_times(scenario.args) for _ in range(repeat)]
+    top_level = [{module: cumulative for module, cumulative, top in run if top} for run in runs]
+    best = min(top_level, key=lambda times: sum(times.values()))
+    total_ms = sum(best.values()) / 1000
+    budget_ms = scenario.budget_ms * budget_scale
+    slowest = sorted(best.items(), key=lambda item: item[1], reverse=True)[:3]
+
+    failures = []
+    modules = {module for module, _, _ in runs[0]}
+    for forbidden in scenario.forbidden:
+        if any(module == forbidden or module.startswith(forbidden + ".") for module in modules):
+            failures.append(f"imports {forbidden}")
+
+    status = "ok" if total_ms <= budget_ms and not failures else "FAIL"
+    print(f"{scenario.name:16} {total_ms:8.1f} ms  (budget {budget_ms:6.0f} ms)  {status}")
+    for module, cumulative in slowest:
+        print(f"    {cumulative / 1000:8.1f} ms  {module}")
+    if total_ms > budget_ms:
+        failures.append(f"import time {total_ms:.1f} ms exceeds the {budget_ms:.0f} ms budget")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CLI import time against a budget.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--budget-scale", type=float, default=1.0,
+        help="Multiplier applied to every scenario's budget (e.g. 2 on a slow CI machine).",
+    )
+    args = parser.parse_args()
+
+    failed = False
+    for scenario in SCENARIOS:
+        failures = run_scenario(scenario, args.repeat, args.budget_scale)
+        for failure in failures:
+            print(f"  FAIL {scenario.name}: {failure}")
+        failed = failed or bool(failures)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
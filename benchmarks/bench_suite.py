@@ -0,0 +1,191 @@
+"""
+Times the hot paths of a query against the fake client: `query_metric` end to end
+(directly and through the request scheduler), protobuf decoding on its own, the sort
+and column reorder step, `print_data` in each output format and `generate_chart`. Each
+stage reports its best time, throughput in points per second and peak traced memory.
+
+    python -m benchmarks.bench_suite --metric token_count --series 1000 --days 90
+    python -m benchmarks.bench_suite --metric model_invocation_latencies --buckets 20
+
+Results can be saved with --save and checked against a saved baseline with
+--compare, which exits non-zero if any stage loses more than --tolerance of its
+throughput or grows its peak memory by more than --tolerance.
+"""
+import argparse
+import contextlib
+import importlib.util
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+from monitor.charting import generate_chart
+from monitor.config.metrics import METRIC_CONFIGS
+from monitor.config.models import MetricConfig
+from monitor.decoding import decode_time_series
+from monitor.gcp_client import RequestScheduler, ScheduledClient, _order_frame, query_metric
+from monitor.main import BINARY_FORMATS, FORMAT_ALIASES, OUTPUT_FORMATS, print_data
+
+from .fake_client import FakeMetricServiceClient
+from .synthetic import MAX_PAGE_POINTS
+
+# The binary formats are only timed when pyarrow is installed.
+DEFAULT_FORMATS = [
+    output_format for output_format in OUTPUT_FORMATS
+    if output_format not in FORMAT_ALIASES
+    and (output_format not in BINARY_FORMATS or importlib.util.find_spec("pyarrow") is not None)
+]
+
+def measure(fn: Callable, repeat: int):
+    """
+    Returns the best wall time of `repeat` calls and the peak memory traced during
+    one more call. Memory is traced separately so tracemalloc's overhead does not
+    distort the timings.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(timings), peak
+
+def bench_metric(metric_config: MetricConfig, args) -> Tuple[int, Dict[str, dict]]:
+    client = FakeMetricServiceClient(
+        n_series=args.series, label_cardinality=args.label_cardinality, n_buckets=args.buckets,
+        page_size=args.page_size, latency_s=args.latency_ms / 1000,
+    )
+    scheduled_client = ScheduledClient(client, RequestScheduler())
+    unprefetched_client = ScheduledClient(client, RequestScheduler(), prefetch_pages=0)
+    histogram = args.buckets > 0 and metric_config.value_field == "distribution_value"
+
+    def run_query(client=client):
+        return query_metric("bench-project", metric_config, args.days, 0, client=client, histogram=histogram)
+
+    # Warm the fake client so the timed runs do not include generating the response.
+    df = run_query()
+    n_points = len(df)
+    raw_series = client.generated_series()
+    unordered = decode_time_series(raw_series, metric_config, histogram=histogram)
+
+    stages = {
+        "query_metric": run_query,
+        "query_metric[scheduled]": lambda: run_query(scheduled_client),
+        "query_metric[prefetch=0]": lambda: run_query(unprefetched_client),
+        "decode": lambda: decode_time_series(raw_series, metric_config, histogram=histogram),
+        "sort_reorder": lambda: _order_frame(unordered, metric_config),
+    }
+    for output_format in args.formats:
+        stages[f"print_data[{output_format}]"] = lambda output_format=output_format: _print_to_null(df, output_format)
+    stages["generate_chart"] = lambda: _chart_in_tempdir(df, metric_config, args.chart_group_by)
+    stages["generate_chart[top_n]"] = lambda: _chart_in_tempdir(df, metric_config, args.chart_group_by, args.chart_top_n)
+
+    results = {}
+    for stage, fn in stages.items():
+        seconds, peak = measure(fn, args.repeat)
+        results[stage] = {"seconds": seconds, "points_per_s": n_points / seconds, "peak_mb": peak / 1e6}
+    return n_points, results
+
+def _print_to_null(df, output_format: str):
+    with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+        print_data(df, output_format, path=os.devnull if output_format == "parquet" else None)
+
+def _chart_in_tempdir(df, metric_config: MetricConfig, group_by: List[str], top_n: int = None):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            generate_chart(df.copy(), metric_config.name, metric_config.value_name, group_by, top_n=top_n)
+        finally:
+            os.chdir(cwd)
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """
+    Returns a description of every stage that regressed against the baseline.
+    """
+    regressions = []
+    for key, result in results.items():
+        reference = baseline.get(key)
+        if reference is None:
+            continue
+        if result["points_per_s"] < reference["points_per_s"] * (1 - tolerance):
+            regressions.append(
+                f"{key}: {result['points_per_s']:,.0f} points/s, baseline {reference['points_per_s']:,.0f}"
+            )
+        if result["peak_mb"] > reference["peak_mb"] * (1 + tolerance):
+            regressions.append(f"{key}: peak {result['peak_mb']:.1f} MB, baseline {reference['peak_mb']:.1f} MB")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the query, output and chart paths offline.")
+    parser.add_argument(
+        "--metric", action="append", choices=list(METRIC_CONFIGS.keys()),
+        help="Metric to benchmark (repeatable; default: model_invocation_count).",
+    )
+    parser.add_argument("--series", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--label-cardinality", type=int, default=8)
+    parser.add_argument(
+        "--page-size", type=int, default=MAX_PAGE_POINTS,
+        help="Points per fake API page (default: the API's maximum of 100,000).",
+    )
+    parser.add_argument(
+        "--latency-ms", type=float, default=0,
+        help="Simulated network time per API call, to measure how much page prefetching hides.",
+    )
+    parser.add_argument(
+        "--buckets", type=int, default=0,
+        help="Histogram buckets per distribution point (0 for counts only, otherwise at least 3).",
+    )
+    parser.add_argument("--formats", type=lambda value: value.split(","), default=DEFAULT_FORMATS)
+    parser.add_argument("--chart-group-by", type=lambda value: value.split(","), default=["model_user_id"])
+    parser.add_argument("--chart-top-n", type=int, default=10, help="Series kept by the generate_chart[top_n] stage.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", type=str, help="Write the results to this JSON file.")
+    parser.add_argument("--compare", type=str, help="Baseline JSON file written by --save.")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.buckets and args.buckets < 3:
+        parser.error("--buckets must be 0 or at least 3.")
+    for output_format in args.formats:
+        if output_format not in OUTPUT_FORMATS:
+            parser.error(f"Unknown output format '{output_format}'.")
+    args.formats = list(dict.fromkeys(FORMAT_ALIASES.get(output_format, output_format) for output_format in args.formats))
+
+    # The per-query log lines would dominate the output and the timings.
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = {}
+    for metric_name in args.metric or ["model_invocation_count"]:
+        n_points, stages = bench_metric(METRIC_CONFIGS[metric_name], args)
+        print(f"{metric_name}: {args.series} series x {args.days} days = {n_points} points")
+        for stage, result in stages.items():
+            print(
+                f"  {stage:24} {result['seconds']:8.3f}s  {result['points_per_s']:14,.0f} points/s"
+                f"  {result['peak_mb']:8.1f} MB peak"
+            )
+            results[f"{metric_name}/{stage}"] = result
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
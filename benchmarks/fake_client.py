@@ -0,0 +1,125 @@
+"""
+An offline stand-in for `monitoring_v3.MetricServiceClient` that answers
+`list_time_series` with synthetic pages, so the query path can be exercised and
+timed without a GCP project.
+"""
+import re
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+from google.cloud import monitoring_v3
+
+from monitor.config.metrics import METRIC_CONFIGS
+from monitor.config.models import MetricConfig
+from monitor.config.query import RESOURCE_LABELS
+
+from .synthetic import MAX_PAGE_POINTS, make_pages, make_time_series
+
+class FakePager:
+    """
+    The subset of `ListTimeSeriesPager` the client code uses: `.pages` and iteration
+    over the time series of every page.
+    """
+
+    def __init__(self, pages: List[monitoring_v3.ListTimeSeriesResponse]):
+        self._pages = pages
+
+    @property
+    def pages(self) -> Iterator[monitoring_v3.ListTimeSeriesResponse]:
+        return iter(self._pages)
+
+    def __iter__(self):
+        for page in self._pages:
+            yield from page.time_series
+
+class FakeMetricServiceClient:
+    """
+    Generates a response for each request from the real metric config of the
+    requested metric type. The scale is fixed per client: `n_series` series whose
+    labels take `label_cardinality` values, and `n_buckets` histogram buckets for
+    distribution metrics (0 for counts only). Each series has one point per
+    alignment period of the requested interval, ending at its end time.
+
+    The project, the metric types (including `one_of(...)` batches), the group-by
+    labels, the page size in points (`page_size` if the request sets none; see
+    make_pages) and the page token of the request are honoured; label filters are not. Responses are generated once
+    per distinct request and reused, so repeated queries measure only the client
+    side, plus `latency_s` of simulated network time per call.
+    """
+
+    def __init__(
+        self,
+        n_series: int = 1000,
+        label_cardinality: int = 8,
+        n_buckets: int = 0,
+        page_size: int = MAX_PAGE_POINTS,
+        metric_configs: Optional[Dict[str, MetricConfig]] = None,
+        latency_s: float = 0.0,
+    ):
+        self.n_series = n_series
+        self.label_cardinality = label_cardinality
+        self.n_buckets = n_buckets
+        self.page_size = page_size
+        self.latency_s = latency_s
+        self._configs_by_type = {config.metric_type: config for config in (metric_configs or METRIC_CONFIGS).values()}
+        self._responses: Dict[bytes, List[monitoring_v3.ListTimeSeriesResponse]] = {}
+        self._lock = threading.Lock()
+        self.request_count = 0
+
+    def list_time_series(self, request: monitoring_v3.ListTimeSeriesRequest = None, **kwargs) -> FakePager:
+        # Pages are generated for the whole request and served from the token on.
+        first_page = int(request.page_token or 0)
+        request = monitoring_v3.ListTimeSeriesRequest(request)
+        request.page_token = ""
+        key = monitoring_v3.ListTimeSeriesRequest.serialize(request)
+        with self._lock:
+            self.request_count += 1
+            pages = self._responses.get(key)
+        if pages is None:
+            pages = self._generate(request)
+            with self._lock:
+                self._responses[key] = pages
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return FakePager(pages[first_page:])
+
+    def generated_series(self) -> list:
+        """
+        Returns the raw TimeSeries messages of every response generated so far.
+        """
+        with self._lock:
+            responses = list(self._responses.values())
+        return [
+            time_series
+            for pages in responses
+            for page in pages
+            for time_series in monitoring_v3.ListTimeSeriesResponse.pb(page).time_series
+        ]
+
+    def _generate(self, request: monitoring_v3.ListTimeSeriesRequest) -> List[monitoring_v3.ListTimeSeriesResponse]:
+        # Quoted strings in the filter that name a metric type; one_of() lists several.
+        metric_types = [value for value in re.findall(r'"([^"]*)"', request.filter) if value in self._configs_by_type]
+        pb = monitoring_v3.ListTimeSeriesRequest.pb(request)
+
+        start = pb.interval.start_time.seconds
+        end = pb.interval.end_time.seconds
+        period = pb.aggregation.alignment_period.seconds or (end - start)
+        group_by_fields = [field.rsplit(".", 1)[-1] for field in pb.aggregation.group_by_fields if field != "metric.type"]
+
+        series = []
+        for metric_type in metric_types:
+            metric_config = self._configs_by_type[metric_type]
+            known = RESOURCE_LABELS + metric_config.metric_labels
+            series.extend(make_time_series(
+                metric_config,
+                n_series=self.n_series,
+                n_days=max(1, (end - start) // period),
+                label_cardinality=self.label_cardinality,
+                end_seconds=end,
+                alignment_period_s=period,
+                n_buckets=self.n_buckets,
+                project_id=request.name.split("/", 1)[-1],
+                label_names=[label for label in group_by_fields if label in known] if group_by_fields else None,
+            ))
+        return make_pages(series, pb.page_size or self.page_size)
@@ -0,0 +1,99 @@
+import time
+from typing import List, Optional
+
+from google.cloud import monitoring_v3
+
+from monitor.config.models import MetricConfig
+from monitor.config.query import ONE_DAY_S, RESOURCE_LABELS
+
+# Points per page of a full-view list_time_series response when the request sets no page size.
+MAX_PAGE_POINTS = 100_000
+
+def make_time_series(
+    metric_config: MetricConfig,
+    n_series: int = 1000,
+    n_days: int = 90,
+    label_cardinality: int = 8,
+    end_seconds: Optional[int] = None,
+    alignment_period_s: int = ONE_DAY_S,
+    n_buckets: int = 0,
+    project_id: Optional[str] = None,
+    label_names: Optional[List[str]] = None,
+) -> list:
+    """
+    Builds raw TimeSeries protobuf messages shaped like an aggregated Vertex AI
+    response for `metric_config`: every resource and metric label cycles through
+    `label_cardinality` values, and each series has one point per alignment period.
+
+    `n_buckets` > 0 gives distribution points an exponential bucket layout with that
+    many buckets (including underflow and overflow). `project_id` fixes the project
+    label, and `label_names` limits the labels to those kept by a group-by.
+    """
+    TimeSeries = monitoring_v3.TimeSeries.pb()
+    end_seconds = end_seconds if end_seconds is not None else int(time.time())
+    if label_names is None:
+        label_names = RESOURCE_LABELS + metric_config.metric_labels
+    histogram = metric_config.value_field == "distribution_value" and n_buckets > 0
+
+    series = []
+    for i in range(n_series):
+        time_series = TimeSeries()
+        time_series.metric.type = metric_config.metric_type
+        time_series.resource.type = "aiplatform.googleapis.com/PublisherModel"
+        for position, name in enumerate(label_names):
+            value = f"{name}_{(i // (position + 1)) % label_cardinality}"
+            if name == "project_id" and project_id is not None:
+                value = project_id
+            if name in RESOURCE_LABELS:
+                time_series.resource.labels[name] = value
+            else:
+                time_series.metric.labels[name] = value
+
+        for day in range(n_days):
+            point = time_series.points.add()
+            point.interval.end_time.seconds = end_seconds - day * alignment_period_s
+            if histogram:
+                distribution = point.value.distribution_value
+                layout = distribution.bucket_options.exponential_buckets
+                layout.num_finite_buckets = n_buckets - 2
+                layout.growth_factor = 2.0
+                layout.scale = 1.0
+                # A bell-shaped spread of samples whose peak moves with the series.
+                peak = (i + day) % n_buckets
+                counts = [max(0, 8 - abs(bucket - peak)) for bucket in range(n_buckets)]
+                distribution.bucket_counts.extend(counts)
+                distribution.count = sum(counts)
+                distribution.mean = 2.0 ** peak
+            elif metric_config.value_field == "distribution_value":
+                point.value.distribution_value.count = i + day
+            elif metric_config.value_field == "double_value":
+                point.value.double_value = float(i + day)
+            else:
+                point.value.int64_value = i + day
+        series.append(time_series)
+    return series
+
+def make_pages(series: list, page_size: int = MAX_PAGE_POINTS) -> List[monitoring_v3.ListTimeSeriesResponse]:
+    """
+    Splits raw TimeSeries messages into proto-plus ListTimeSeriesResponse pages of at
+    most `page_size` points, as the API pages a full-view response: whole series are
+    added to a page until the next one would overflow it, and a series larger than
+    `page_size` gets a page of its own. Every page but the last carries a
+    `next_page_token`: the index of the next page.
+    """
+    Response = monitoring_v3.ListTimeSeriesResponse.pb()
+    pages = []
+    chunk, chunk_points = [], 0
+    for time_series in series:
+        points = len(time_series.points)
+        if chunk and chunk_points + points > page_size:
+            pages.append(chunk)
+            chunk, chunk_points = [], 0
+        chunk.append(time_series)
+        chunk_points += points
+    if chunk:
+        pages.append(chunk)
+    pages = [Response(time_series=chunk) for chunk in pages]
+    for index, response in enumerate(pages[:-1]):
+        response.next_page_token = str(index + 1)
+    return [monitoring_v3.ListTimeSeriesResponse.wrap(response) for response in pages]
@@ -0,0 +1,143 @@
+import contextlib
+import datetime
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+from typing import Iterable, List, Optional, Set
+
+import pandas as pd
+
+from .config.models import MetricConfig
+from .config.query import CACHE_ENV_VAR
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metric_days (
+    project_id TEXT NOT NULL,
+    config_key TEXT NOT NULL,
+    metric_name TEXT NOT NULL,
+    day TEXT NOT NULL,
+    rows TEXT NOT NULL,
+    fetched_at TEXT NOT NULL,
+    PRIMARY KEY (project_id, config_key, day)
+)
+"""
+
+class MetricCache:
+    """
+    A local SQLite cache of closed (complete) days of metric data.
+
+    Each entry holds every row of one UTC day for one project and one query shape
+    (metric config, aligner/reducer and any other request parameters). A day is
+    stored even when it has no rows, so an empty day is not fetched again.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.path = os.path.join(self.cache_dir, "metrics.sqlite")
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # A fresh connection per call keeps the cache safe to use from worker threads.
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def config_key(metric_config: MetricConfig, **params) -> str:
+        """
+        Builds a stable key for a query shape from the metric config and any extra
+        request parameters that change the returned rows.
+        """
+        payload = {"config": metric_config.model_dump(), "params": params}
+        encoded = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def cached_days(self, project_id: str, config_key: str, days: Iterable[datetime.date]) -> Set[datetime.date]:
+        """
+        Returns the subset of `days` that are already in the cache.
+        """
+        wanted = {day.isoformat() for day in days}
+        if not wanted:
+            return set()
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT day FROM metric_days WHERE project_id = ? AND config_key = ?",
+                (project_id, config_key),
+            ).fetchall()
+        return {datetime.date.fromisoformat(day) for (day,) in rows if day in wanted}
+
+    def load(self, project_id: str, config_key: str, days: Iterable[datetime.date], with_time: bool = False) -> pd.DataFrame:
+        """
+        Loads the cached rows of the given days as a single DataFrame. `date` holds
+        datetimes if `with_time` is set (a sub-daily alignment period, which is part
+        of the config key) and plain dates otherwise, whatever the stored values are.
+        """
+        day_keys = sorted(day.isoformat() for day in days)
+        if not day_keys:
+            return pd.DataFrame()
+        placeholders = ",".join("?" for _ in day_keys)
+        with self._connect() as conn:
+            payloads = conn.execute(
+                f"SELECT rows FROM metric_days WHERE project_id = ? AND config_key = ? AND day IN ({placeholders})",
+                [project_id, config_key] + day_keys,
+            ).fetchall()
+
+        records = []
+        for (payload,) in payloads:
+            records.extend(json.loads(payload))
+        if not records:
+            return pd.DataFrame()
+
+        df = pd.DataFrame(records)
+        dates = pd.to_datetime(df["date"])
+        df["date"] = dates if with_time else dates.dt.date
+        return df
+
+    def store(self, project_id: str, config_key: str, metric_name: str, df: pd.DataFrame, days: List[datetime.date]):
+        """
+        Stores the rows of `df` for each of `days`. Days without rows are stored empty.
+        """
+        if not days:
+            return
+        by_day = {}
+        if not df.empty:
+            day_keys = pd.to_datetime(df["date"]).dt.strftime("%Y-%m-%d")
+            for day_key, group in df.groupby(day_keys, sort=False):
+                by_day[day_key] = group.to_json(orient="records", date_format="iso")
+
+        fetched_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO metric_days VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (project_id, config_key, metric_name, day.isoformat(), by_day.get(day.isoformat(), "[]"), fetched_at)
+                    for day in days
+                ],
+            )
+
+    def invalidate(self, project_id: Optional[str] = None, metric_name: Optional[str] = None) -> int:
+        """
+        Deletes cached days, optionally limited to one project and/or metric.
+        Returns the number of deleted entries.
+        """
+        clauses, params = [], []
+        if project_id:
+            clauses.append("project_id = ?")
+            params.append(project_id)
+        if metric_name:
+            clauses.append("metric_name = ?")
+            params.append(metric_name)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._connect() as conn:
+            deleted = conn.execute(f"DELETE FROM metric_days{where}", params).rowcount
+        logging.info(f"Removed {deleted} cached day(s) from {self.path}.")
+        return deleted
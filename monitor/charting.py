@@ -1,56 +1,221 @@
 import logging
-import matplotlib.pyplot as plt
+import os
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 import numpy as np
 import pandas as pd
 
-def generate_chart(df: pd.DataFrame, metric_name: str, value_column: str, group_by: list = None):
+from .config.models import MetricConfig
+from .histograms import histogram_columns, merge_histograms, summarize
+from . import instrumentation
+
+# Charts are drawn on standalone Figure objects with an Agg canvas rather than through
+# pyplot's global state, so they can be rendered from several threads or processes.
+
+# Lines with more points are downsampled (see lttb) before drawing, and only lines
+# with at most MARKER_MAX_POINTS points get a marker per point.
+MAX_CHART_POINTS = 1000
+MARKER_MAX_POINTS = 100
+# Label of the line that series outside the top N are folded into.
+OTHER_SERIES = "other"
+
+def _new_figure():
+    fig = Figure(figsize=(14, 8))
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot()
+
+def _save_png(fig: Figure, filename: str, metric_name: str):
+    # Layout and rasterisation happen here, so this is where most of a chart's time goes.
+    with instrumentation.span("render_png", metric_name):
+        fig.tight_layout()
+        fig.savefig(filename)
+    if instrumentation.is_enabled():
+        instrumentation.count("bytes_written", os.path.getsize(filename), metric_name)
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Returns the indices of `threshold` points of (x, y) picked by largest-triangle-
+    three-buckets: the first and last points, plus one point from each of
+    `threshold - 2` equal buckets in between. From each bucket, the point kept is the
+    one forming the largest triangle with the previously kept point and the mean of
+    the next bucket, which preserves peaks and the overall shape of the line.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    kept = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start, next_end = (edges[bucket + 1], edges[bucket + 2]) if bucket + 2 < len(edges) else (n - 1, n)
+        mean_x, mean_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        areas = np.abs((x[kept] - mean_x) * (y[start:end] - y[kept]) - (x[kept] - x[start:end]) * (mean_y - y[kept]))
+        kept = start + int(np.argmax(areas))
+        indices[bucket + 1] = kept
+    return indices
+
+def fold_top_n(df: pd.DataFrame, group_by: list, value_column: str, top_n: int = None) -> pd.DataFrame:
+    """
+    Keeps the `top_n` group_by combinations with the largest total `value_column` and
+    relabels the rows of all the others as OTHER_SERIES, so they add up to one line.
+    Returns `df` itself when there is nothing to fold.
+    """
+    if not top_n or not group_by:
+        return df
+    totals = df.groupby(group_by, observed=True, dropna=False)[value_column].sum()
+    if len(totals) <= top_n:
+        return df
+    top = totals.nlargest(top_n).index
+    keys = pd.MultiIndex.from_frame(df[group_by]) if len(group_by) > 1 else pd.Index(df[group_by[0]])
+    folded = ~keys.isin(top)
+    df = df.copy()
+    for col in group_by:
+        df[col] = df[col].astype(object)
+        df.loc[folded, col] = OTHER_SERIES
+    return df
+
+def _plot_lines(ax, plot_df: pd.DataFrame, max_points: int = MAX_CHART_POINTS):
+    """
+    Draws each column of `plot_df` (indexed by date) as a line through its present
+    points, downsampled to `max_points` with lttb, so drawing time does not grow
+    with the length of the window.
+    """
+    dates = plot_df.index.values
+    # The folded "other" line is drawn (and listed in the legend) after the named ones.
+    is_other = lambda label: OTHER_SERIES in (label if isinstance(label, tuple) else (label,))
+    for label, column in sorted(plot_df.items(), key=lambda item: is_other(item[0])):
+        values = column.to_numpy(dtype=np.float64, na_value=np.nan)
+        present = ~np.isnan(values)
+        x, y = dates[present], values[present]
+        if len(x) > max_points:
+            keep = lttb(x.astype(np.int64).astype(np.float64), y, max_points)
+            x, y = x[keep], y[keep]
+        if isinstance(label, tuple):
+            # A folded group is "other" in every grouping column; name it once.
+            parts = [part for i, part in enumerate(label) if part != OTHER_SERIES or OTHER_SERIES not in label[:i]]
+            label = ", ".join(str(part) for part in parts)
+        ax.plot(x, y, marker='o' if len(x) <= MARKER_MAX_POINTS else None, linestyle='-', label=str(label))
+
+def _draw_lines(ax, data, max_points: int = MAX_CHART_POINTS, folded: bool = False):
+    """
+    Draws `data` (a Series or the columns of a DataFrame, indexed by date) with
+    pandas' plot, as charts have always been drawn, so short charts keep pandas' date
+    axis and stay byte-for-byte identical. Only when top-N folding changed the lines
+    or a line has more than `max_points` points are they drawn by _plot_lines.
+    """
+    frame = data.to_frame() if isinstance(data, pd.Series) else data
+    if folded or frame.count().max() > max_points:
+        _plot_lines(ax, frame, max_points)
+    else:
+        data.plot(kind='line', marker='o', linestyle='-', ax=ax)
+
+def generate_chart(df: pd.DataFrame, metric_name: str, value_column: str, group_by: list = None, period_label: str = "Daily", top_n: int = None, max_points: int = MAX_CHART_POINTS):
     """
     Generates and saves a time-series line chart from the metric data.
-    If group_by columns are provided, it plots a separate line for each category combination.
+    If group_by columns are provided, it plots a separate line for each category combination;
+    with `top_n`, only for the largest `top_n` of them, plus one line for all the others.
     """
     if df.empty:
         logging.warning(f"No data available to generate a chart for {metric_name}.")
         return
 
-    plt.figure(figsize=(14, 8))
+    fig, ax = _new_figure()
     
     # Ensure date column is in datetime format
     df['date'] = pd.to_datetime(df['date'])
     
-    title = f'Daily {metric_name} Over Time'
+    title = f'{period_label} {metric_name} Over Time'
 
     # Check for valid grouping columns
     valid_group_by = [col for col in group_by if col in df.columns] if group_by else []
 
     if not valid_group_by:
         # Plot a single line for the total value over time
-        time_series_data = df.groupby('date')[value_column].sum()
-        time_series_data.plot(kind='line', marker='o', linestyle='-')
+        time_series_data = df.groupby('date', observed=True)[value_column].sum()
+        _draw_lines(ax, time_series_data, max_points)
     else:
         # Create a pivot table for plotting multiple lines
-        pivot_df = df.groupby(['date'] + valid_group_by)[value_column].sum()
+        folded_df = fold_top_n(df, valid_group_by, value_column, top_n)
+        folded = folded_df is not df
+        df = folded_df
+        pivot_df = df.groupby(['date'] + valid_group_by, observed=True)[value_column].sum()
         
         try:
             # Unstack the grouping columns to create separate columns for each category
             plot_df = pivot_df.unstack(level=valid_group_by)
-            plot_df.plot(kind='line', marker='o', linestyle='-')
+            _draw_lines(ax, plot_df, max_points, folded)
             
             group_by_str = ' & '.join(valid_group_by)
             title += f' by {group_by_str}'
-            plt.legend(title=group_by_str, bbox_to_anchor=(1.05, 1), loc='upper left')
+            ax.legend(title=group_by_str, bbox_to_anchor=(1.05, 1), loc='upper left')
         except Exception as e:
             logging.error(f"Could not generate multi-line chart, possibly due to data structure: {e}")
             logging.info("Falling back to a single total line chart.")
-            time_series_data = df.groupby('date')[value_column].sum()
-            time_series_data.plot(kind='line', marker='o', linestyle='-')
-
-    plt.title(title)
-    plt.ylabel(f'Total {value_column}')
-    plt.xlabel('Date')
-    plt.grid(True)
-    plt.tight_layout()
-    
+            time_series_data = df.groupby('date', observed=True)[value_column].sum()
+            _draw_lines(ax, time_series_data, max_points)
+
+    ax.set_title(title)
+    ax.set_ylabel(f'Total {value_column}')
+    ax.set_xlabel('Date')
+    ax.grid(True)
+
     filename = f"{metric_name}_chart.png"
-    plt.savefig(filename)
+    _save_png(fig, filename, metric_name)
     logging.info(f"Chart saved to {filename}")
-    plt.close()
\ No newline at end of file
+    return filename
+
+def generate_percentile_chart(df: pd.DataFrame, metric_name: str, value_column: str, percentiles: list, group_by: list = None, period_label: str = "Daily", top_n: int = None, max_points: int = MAX_CHART_POINTS):
+    """
+    Generates and saves a time-series chart of percentiles of a distribution metric.
+    Histograms are merged per date (and per group_by combination) before the
+    percentiles are computed, so each line reflects all series in its group. With
+    `top_n`, groups outside the `top_n` largest by sample count are merged into one.
+    """
+    if df.empty or not histogram_columns(df):
+        logging.warning(f"No histogram data available to generate a percentile chart for {metric_name}.")
+        return
+
+    fig, ax = _new_figure()
+
+    df['date'] = pd.to_datetime(df['date'])
+    valid_group_by = [col for col in group_by if col in df.columns] if group_by else []
+    folded_df = fold_top_n(df, valid_group_by, value_column, top_n)
+    folded = folded_df is not df
+    df = folded_df
+
+    merged = summarize(merge_histograms(df, ['date'] + valid_group_by, value_column), value_column, percentiles)
+    percentile_cols = [f"p{q:g}" for q in percentiles]
+    title = f'{period_label} {metric_name} Percentiles Over Time'
+
+    if not valid_group_by:
+        _draw_lines(ax, merged.set_index('date')[percentile_cols], max_points)
+        ax.legend(title='Percentile')
+    else:
+        plot_df = merged.set_index(['date'] + valid_group_by)[percentile_cols].unstack(level=valid_group_by)
+        _draw_lines(ax, plot_df, max_points, folded)
+        group_by_str = ' & '.join(valid_group_by)
+        title += f' by {group_by_str}'
+        ax.legend(title=f'Percentile, {group_by_str}', bbox_to_anchor=(1.05, 1), loc='upper left')
+
+    ax.set_title(title)
+    ax.set_ylabel(metric_name)
+    ax.set_xlabel('Date')
+    ax.grid(True)
+
+    filename = f"{metric_name}_percentiles_chart.png"
+    _save_png(fig, filename, metric_name)
+    logging.info(f"Chart saved to {filename}")
+    return filename
+
+def render_metric_chart(df: pd.DataFrame, metric_config: MetricConfig, group_by: list = None, period_label: str = "Daily", percentiles: list = None, top_n: int = None):
+    """
+    Charts a metric: percentiles for distribution metrics when requested, totals otherwise.
+    Takes only picklable arguments, so it can be submitted to a process pool.
+    Returns the saved filename, or None if there was nothing to chart.
+    """
+    with instrumentation.span("chart", metric_config.name):
+        if percentiles and metric_config.value_field == "distribution_value":
+            return generate_percentile_chart(df, metric_config.name, metric_config.value_name, percentiles, group_by, period_label, top_n)
+        return generate_chart(df, metric_config.name, metric_config.value_name, group_by, period_label, top_n)
@@ -0,0 +1,138 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+# Kinds of finished work recorded in the manifest.
+UNITS = "units"    # one batch of metrics fetched for one project
+CHUNKS = "chunks"  # one time chunk of such a fetch
+CHARTS = "charts"  # one rendered report chart
+
+class CheckpointMismatch(Exception):
+    """
+    Raised when resuming from a checkpoint that was written for different run parameters.
+    """
+
+class Checkpoint:
+    """
+    The progress of one run, kept on disk so an interrupted run can be resumed.
+
+    `manifest.json` holds the run parameters, the time the run started (every
+    query window is measured back from it, so a resumed run asks for exactly the
+    same windows) and the finished work: fetched metric batches per project, time
+    chunks of long windows and rendered charts. Fetched frames are stored next to
+    it in `results/`. The manifest is rewritten atomically after each piece of
+    work, so a crash or kill loses at most the work in flight.
+    """
+
+    def __init__(self, directory: str, params: Dict[str, Any], resume: bool = False):
+        self.directory = os.path.expanduser(directory)
+        self.path = os.path.join(self.directory, "manifest.json")
+        self.results_dir = os.path.join(self.directory, "results")
+        self._lock = threading.Lock()
+        params_key = hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+        manifest = self._read() if resume else None
+        if manifest is not None and manifest.get("params_key") != params_key:
+            raise CheckpointMismatch(
+                f"The checkpoint in {self.directory} was written for different run parameters; "
+                "run without --resume to start over."
+            )
+        if manifest is None:
+            if resume:
+                logging.info(f"No checkpoint found in {self.directory}; starting from the beginning.")
+            self._remove_results(self._read())
+            manifest = {
+                "params": params,
+                "params_key": params_key,
+                "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                UNITS: {},
+                CHUNKS: {},
+                CHARTS: {},
+            }
+        else:
+            logging.info(
+                f"Resuming from {self.path}: {len(manifest[UNITS])} fetch(es), {len(manifest[CHUNKS])} "
+                f"chunk(s) and {len(manifest[CHARTS])} chart(s) already done."
+            )
+        os.makedirs(self.results_dir, exist_ok=True)
+        self.manifest = manifest
+        self.now = datetime.datetime.fromisoformat(manifest["started_at"])
+        self._write()
+
+    def _read(self) -> Optional[dict]:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable checkpoint {self.path}: {e}")
+            return None
+
+    def _remove_results(self, manifest: Optional[dict]):
+        # Only the files a previous run recorded are removed: the directory may
+        # hold anything else, and none of it is ours to delete.
+        if not manifest:
+            return
+        for kind in (UNITS, CHUNKS):
+            for filename in manifest.get(kind, {}).values():
+                try:
+                    os.remove(os.path.join(self.results_dir, os.path.basename(filename)))
+                except OSError:
+                    pass
+
+    def _write(self):
+        # Written to a temporary file and renamed, so the manifest is never partial.
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(temp_path, self.path)
+
+    def load(self, kind: str, key: str) -> Optional[Any]:
+        """
+        Returns the stored result of a finished piece of work, or None if it is not done.
+        """
+        with self._lock:
+            filename = self.manifest[kind].get(key)
+        if filename is None:
+            return None
+        try:
+            return pd.read_pickle(os.path.join(self.results_dir, filename))
+        except Exception as e:
+            logging.warning(f"Could not load checkpointed {kind[:-1]} '{key}', fetching it again: {e}")
+            return None
+
+    def save(self, kind: str, key: str, value: Any):
+        """
+        Stores the result of a finished piece of work and records it in the manifest.
+        """
+        filename = hashlib.sha256(f"{kind}:{key}".encode("utf-8")).hexdigest()[:32] + ".pkl"
+        pd.to_pickle(value, os.path.join(self.results_dir, filename))
+        with self._lock:
+            self.manifest[kind][key] = filename
+            self._write()
+
+    def finished_charts(self) -> Dict[str, str]:
+        """
+        Returns {metric name: chart file} for the charts already rendered whose files still exist.
+        """
+        with self._lock:
+            charts = dict(self.manifest[CHARTS])
+        return {metric: filename for metric, filename in charts.items() if os.path.exists(filename)}
+
+    def mark_chart(self, metric_name: str, filename: str):
+        with self._lock:
+            self.manifest[CHARTS][metric_name] = filename
+            self._write()
+
+def unit_key(project_id: str, metric_configs) -> str:
+    return f"{project_id}|{','.join(config.name for config in metric_configs)}"
+
+def chunk_key(unit: str, start_time: datetime.datetime, end_time: datetime.datetime) -> str:
+    return f"{unit}|{start_time.isoformat()}|{end_time.isoformat()}"
@@ -119,4 +119,12 @@ METRIC_CONFIGS = {
         aligner="ALIGN_MEAN",
         reducer="REDUCE_MEAN",
     ),
-}
\ No newline at end of file
+}
+# (usage, limit) pairs compared by wide queries: a DELTA usage total per period and
+# the per-second limit it is consumed against, in the same unit.
+UTILISATION_RATIOS = [
+    ("consumed_throughput", "dedicated_character_limit"),
+    ("consumed_throughput", "dedicated_character_project_max_limit"),
+    ("consumed_token_throughput", "dedicated_token_limit"),
+    ("consumed_token_throughput", "dedicated_token_project_max_limit"),
+]
@@ -0,0 +1,23 @@
+# Query settings shared by the CLI and the client. This module must stay free of
+# heavy imports: main.py reads it to build the argument parser before anything
+# else is loaded.
+
+ONE_DAY_S = 86400
+
+# Supported alignment periods. Each divides a day, so every resolution shares
+# the UTC midnight grid used by the cache.
+RESOLUTIONS = {
+    "1m": 60,
+    "5m": 300,
+    "15m": 900,
+    "1h": 3600,
+    "6h": 21600,
+    "1d": ONE_DAY_S,
+}
+
+RESOURCE_LABELS = ['project_id', 'location', 'publisher', 'model_version_id', 'model_user_id']
+
+# The fixed order of the leading columns of every result table.
+PREFERRED_ORDER = ['date', 'location', 'project_id', 'model_user_id', 'model_version_id']
+
+CACHE_ENV_VAR = "PT_MONITOR_CACHE_DIR"
@@ -0,0 +1,168 @@
+import collections
+import datetime
+import functools
+import logging
+import os
+from typing import Dict, Iterable, List, Optional
+
+import dateutil.tz
+import numpy as np
+import pandas as pd
+
+try:
+    import zoneinfo
+except ImportError:  # Python 3.8
+    zoneinfo = None
+
+from .config.models import MetricConfig
+from .histograms import SUM_COLUMN, bucket_bounds, bucket_columns
+from . import instrumentation
+
+# NumPy dtype for each TypedValue field; anything else is kept as Python objects.
+_VALUE_DTYPES = {
+    "int64_value": np.int64,
+    "double_value": np.float64,
+    "bool_value": np.bool_,
+    "distribution_value": np.int64,
+}
+
+@functools.lru_cache(maxsize=None)
+def _local_timezone() -> datetime.tzinfo:
+    """
+    Returns the local time zone named by $TZ or the /etc/localtime link, as a
+    ZoneInfo (or, before Python 3.9, a dateutil zone file), whose transition table
+    lets pandas convert whole arrays at once. Falls back to dateutil's tzlocal,
+    which is correct but converts value by value.
+    """
+    name = os.environ.get("TZ", "").lstrip(":")
+    if not name:
+        target = os.path.realpath("/etc/localtime")
+        name = target.split("zoneinfo/", 1)[1] if "zoneinfo/" in target else ""
+    if name and zoneinfo is not None:
+        try:
+            return zoneinfo.ZoneInfo(name)
+        except (ValueError, zoneinfo.ZoneInfoNotFoundError):
+            pass
+    return (dateutil.tz.gettz(name) if name else None) or dateutil.tz.tzlocal()
+
+def timestamps_to_dates(
+    seconds: np.ndarray,
+    tz: Optional[datetime.tzinfo] = None,
+    with_time: bool = False,
+) -> np.ndarray:
+    """
+    Converts an array of epoch seconds to an object array of dates in `tz` (local time
+    if None), or with `with_time` to a datetime64 array of naive wall-clock times.
+    The whole array is converted in one vectorized step.
+    """
+    moments = pd.to_datetime(seconds, unit="s", utc=True).tz_convert(tz or _local_timezone()).tz_localize(None)
+    if with_time:
+        return moments.values.astype("datetime64[us]")
+    return moments.date
+
+def decode_time_series(
+    series: Iterable,
+    metric_config: MetricConfig,
+    label_offset_s: int = 0,
+    tz: Optional[datetime.tzinfo] = None,
+    with_time: bool = False,
+    histogram: bool = False,
+) -> pd.DataFrame:
+    """
+    Decodes raw `google.monitoring.v3.TimeSeries` protobuf messages into one row per point.
+
+    The messages are read directly (not through proto-plus wrappers) and the result is
+    built column by column: values and timestamps go into typed NumPy arrays, and every
+    label becomes a categorical whose codes are repeated once per point of its series.
+    Each point is dated by its end time minus `label_offset_s` (see timestamps_to_dates).
+
+    With `histogram` set, distribution points also keep their bucket counts (see
+    _decode_histograms) and the sum of their samples.
+    """
+    value_field = metric_config.value_field
+    series_labels: List[Dict[str, str]] = []
+    point_counts: List[int] = []
+    end_seconds: List[int] = []
+    values: list = []
+    histogram = histogram and value_field == "distribution_value"
+    series_layouts: list = []
+    bucket_counts: list = []
+    sums: List[float] = []
+
+    for time_series in series:
+        points = time_series.points
+        if not points:
+            continue
+        labels = dict(time_series.resource.labels)
+        labels.update(time_series.metric.labels)
+        series_labels.append(labels)
+        point_counts.append(len(points))
+
+        end_seconds.extend([point.interval.end_time.seconds for point in points])
+        if histogram:
+            distributions = [point.value.distribution_value for point in points]
+            values.extend([distribution.count for distribution in distributions])
+            sums.extend([distribution.mean * distribution.count for distribution in distributions])
+            bucket_counts.extend([distribution.bucket_counts for distribution in distributions])
+            series_layouts.append(distributions[0].bucket_options)
+        elif value_field == "distribution_value":
+            values.extend([point.value.distribution_value.count for point in points])
+        else:
+            values.extend([getattr(point.value, value_field) for point in points])
+
+    if not series_labels:
+        return pd.DataFrame()
+
+    repeats = np.array(point_counts, dtype=np.int64)
+    label_names = list(dict.fromkeys(name for labels in series_labels for name in labels))
+
+    columns = {}
+    for name in label_names:
+        per_series = [labels.get(name) for labels in series_labels]
+        categories = sorted({value for value in per_series if value is not None})
+        lookup = {value: code for code, value in enumerate(categories)}
+        codes = np.array([lookup.get(value, -1) for value in per_series], dtype=np.int32)
+        columns[name] = pd.Categorical.from_codes(np.repeat(codes, repeats), categories=categories)
+
+    seconds = np.array(end_seconds, dtype=np.int64) - label_offset_s
+    columns["date"] = timestamps_to_dates(seconds, tz, with_time)
+    columns[metric_config.value_name] = np.array(values, dtype=_VALUE_DTYPES.get(value_field, object))
+
+    if histogram:
+        columns[SUM_COLUMN] = np.array(sums, dtype=np.float64)
+        bounds, counts = _decode_histograms(series_layouts, bucket_counts, repeats, metric_config)
+        columns.update(zip(bucket_columns(bounds), counts.T))
+
+    with instrumentation.span("dataframe", metric_config.name):
+        return pd.DataFrame(columns)
+
+def _decode_histograms(series_layouts: list, bucket_counts: list, repeats: np.ndarray, metric_config: MetricConfig):
+    """
+    Packs per-point bucket counts into a (points x buckets) int64 array.
+
+    All rows must share one bucket layout to be comparable, so the most common layout
+    is used; points of series with a different layout are left at zero and reported.
+    Returns the finite boundaries of that layout and the count array.
+    """
+    layout_keys = [layout.SerializeToString(deterministic=True) for layout in series_layouts]
+    reference_key, _ = collections.Counter(layout_keys).most_common(1)[0]
+    bounds = bucket_bounds(series_layouts[layout_keys.index(reference_key)])
+
+    counts = np.zeros((len(bucket_counts), bounds.size + 1), dtype=np.int64)
+    row = 0
+    skipped = 0
+    for layout_key, n_points in zip(layout_keys, repeats.tolist()):
+        if layout_key != reference_key:
+            skipped += 1
+        else:
+            for offset in range(n_points):
+                point_counts = bucket_counts[row + offset][:counts.shape[1]]
+                counts[row + offset, :len(point_counts)] = point_counts
+        row += n_points
+
+    if skipped:
+        logging.warning(
+            f"{skipped} series of {metric_config.metric_type} use a different bucket layout; "
+            "their bucket counts are left empty."
+        )
+    return bounds, counts
@@ -0,0 +1,93 @@
+import sys
+from typing import BinaryIO, Optional, TextIO
+
+import pandas as pd
+
+# Rows per block when writing NDJSON or Arrow record batches.
+CHUNK_ROWS = 65536
+
+class _CountingWriter:
+    """
+    A binary sink that counts the bytes written to it, for the bytes_written counter.
+    """
+
+    def __init__(self, out: BinaryIO):
+        self.out = out
+        self.closed = False
+        self.written = 0
+
+    def write(self, data) -> int:
+        self.written += len(data)
+        return self.out.write(data)
+
+    def flush(self):
+        self.out.flush()
+
+def to_arrow_table(df: pd.DataFrame):
+    """
+    Converts a result frame to an Arrow table that keeps its column types: `date`
+    becomes date32 (or a timestamp at sub-daily resolution), values keep their
+    int64/float64 type and labels become dictionary arrays. Labels that lost their
+    categorical type (rows read from the cache, or projects merged with different
+    label values) are made categorical again first.
+    """
+    import pyarrow as pa
+
+    labels = [
+        col for col in df.columns
+        if col != "date"
+        and not isinstance(df[col].dtype, pd.CategoricalDtype)
+        and (pd.api.types.is_object_dtype(df[col]) or pd.api.types.is_string_dtype(df[col]))
+    ]
+    if labels:
+        df = df.astype({col: "category" for col in labels})
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+def write_parquet(df: pd.DataFrame, path: str) -> int:
+    """
+    Writes a frame to a Parquet file and returns the number of bytes written.
+    """
+    import pyarrow.parquet as pq
+
+    with open(path, "wb") as f:
+        sink = _CountingWriter(f)
+        pq.write_table(to_arrow_table(df), sink)
+    return sink.written
+
+def write_arrow(df: pd.DataFrame, path: Optional[str] = None) -> int:
+    """
+    Writes a frame as an Arrow IPC stream to `path`, or to stdout, in record batches of
+    CHUNK_ROWS rows, so a reader such as `pyarrow.ipc.open_stream` can map the columns
+    without parsing. Returns the number of bytes written.
+    """
+    table = to_arrow_table(df)
+    if path is None:
+        # Text already printed must reach the pipe before the binary stream starts.
+        sys.stdout.flush()
+        return _write_ipc_stream(table, sys.stdout.buffer)
+    with open(path, "wb") as f:
+        return _write_ipc_stream(table, f)
+
+def _write_ipc_stream(table, out: BinaryIO) -> int:
+    import pyarrow as pa
+
+    sink = _CountingWriter(out)
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table, max_chunksize=CHUNK_ROWS)
+    sink.flush()
+    return sink.written
+
+def write_ndjson(df: pd.DataFrame, out: TextIO) -> int:
+    """
+    Writes a frame as newline-delimited JSON, CHUNK_ROWS rows at a time, so the full
+    text is never held in memory. Dates are written as ISO 8601 strings ('2025-01-31',
+    or '2025-01-31T10:00:00' at sub-daily resolution) instead of epoch milliseconds.
+    Returns the number of characters written.
+    """
+    written = 0
+    for start in range(0, len(df), CHUNK_ROWS):
+        chunk = df.iloc[start:start + CHUNK_ROWS]
+        if "date" in chunk.columns and chunk["date"].dtype == object:
+            chunk = chunk.assign(date=chunk["date"].astype(str))
+        written += out.write(chunk.to_json(orient="records", lines=True, date_format="iso", date_unit="s"))
+    return written
@@ -1,16 +1,42 @@
+import concurrent.futures
 import datetime
+import functools
 import logging
+import queue
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
 import google.auth
+import google.auth.credentials
+import google.auth.exceptions
 from google.api_core import exceptions
 from google.cloud import monitoring_v3
 from google.protobuf import duration_pb2
 import pandas as pd
 
+from .cache import MetricCache
+from .checkpoint import CHUNKS, UNITS, Checkpoint, chunk_key, unit_key
 from .config.models import MetricConfig
+from .config.query import ONE_DAY_S, PREFERRED_ORDER, RESOLUTIONS, RESOURCE_LABELS
+from .decoding import decode_time_series
+from .histograms import is_histogram_column
+from .wide import WIDE_LABELS, align_wide
+from . import instrumentation
+
+# Cloud Monitoring rejects alignment periods shorter than one minute.
+MIN_ALIGNMENT_PERIOD_S = 60
+# How long after midnight UTC a day is considered complete enough to cache.
+CACHE_SETTLE_S = 3600
+# Number of aligned points per series requested in one chunk of a long window.
+CHUNK_POINTS = 1440
 
-def log_authentication_method():
+def log_authentication_method() -> Optional[google.auth.credentials.Credentials]:
     """
     Determines and logs the authentication method being used by the Google Cloud client library.
+    Returns the default credentials, so they can be reused for every client in the run,
+    or None if they could not be loaded.
     """
     try:
         credentials, project_id = google.auth.default()
@@ -22,126 +48,1105 @@ def log_authentication_method():
              auth_type = f"User Credentials" # User credentials don't expose the email directly
         
         logging.info(f"Authentication successful. Using credentials of type: {auth_type}")
+        return credentials
 
-    except exceptions.DefaultCredentialsError:
+    except google.auth.exceptions.DefaultCredentialsError:
         logging.error("Authentication failed. Could not find default credentials.")
         logging.error("Please run 'gcloud auth application-default login' or set the GOOGLE_APPLICATION_CREDENTIALS environment variable.")
     except Exception as e:
         logging.error(f"An unexpected error occurred during authentication: {e}")
+    return None
+
+class MetricQueryError(Exception):
+    """
+    Raised when a metric could not be queried (as opposed to returning no data),
+    after any retries. The original API error is the exception's __cause__.
+    """
+
+    def __init__(self, project_id: str, metric_names: List[str], message: str):
+        super().__init__(f"{', '.join(metric_names)} in project '{project_id}': {message}")
+        self.project_id = project_id
+        self.metric_names = metric_names
+
+# Errors that mean "try again later" rather than "this request is wrong".
+RETRYABLE_ERRORS = (
+    exceptions.ResourceExhausted,
+    exceptions.DeadlineExceeded,
+    exceptions.ServiceUnavailable,
+    exceptions.InternalServerError,
+    exceptions.Aborted,
+)
+# Of those, the ones that mean the API or the quota is overloaded.
+THROTTLING_ERRORS = (exceptions.ResourceExhausted, exceptions.ServiceUnavailable, exceptions.DeadlineExceeded)
+
+class RequestScheduler:
+    """
+    Paces, retries and limits every API call of a run.
+
+    - Per-project read budget: with `requests_per_minute`, calls to each project are
+      spaced evenly so they stay within that many requests per minute.
+    - Retries: retryable errors are retried up to `max_attempts` times in total, with
+      full-jitter exponential backoff (a random delay of up to `backoff_s * 2**n`,
+      capped at `max_backoff_s`). The last error is raised, never swallowed.
+    - Adaptive concurrency: at most `limit` calls run at once. It starts at
+      `max_concurrency`, is halved whenever the API throttles, and grows back by one
+      after every `recovery_successes` successful calls in a row.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        requests_per_minute: Optional[float] = None,
+        max_attempts: int = 6,
+        backoff_s: float = 1.0,
+        max_backoff_s: float = 32.0,
+        recovery_successes: int = 10,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = self.max_concurrency
+        self.interval_s = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_s = backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.recovery_successes = recovery_successes
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._successes = 0
+        self._next_slot: Dict[str, float] = {}
+
+    def call(self, project_id: str, fn: Callable, *args, **kwargs):
+        """
+        Calls `fn(*args, **kwargs)` for `project_id` under the scheduler's budget,
+        concurrency limit and retry policy, and returns its result.
+        """
+        for attempt in range(self.max_attempts):
+            self._wait_for_budget(project_id)
+            self._acquire()
+            try:
+                result = fn(*args, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                throttled = isinstance(e, THROTTLING_ERRORS)
+                self._release(throttled)
+                instrumentation.count("api_retryable_errors")
+                if throttled:
+                    instrumentation.count("api_throttled")
+                if attempt + 1 == self.max_attempts:
+                    raise
+                delay = random.uniform(0, min(self.max_backoff_s, self.backoff_s * 2 ** attempt))
+                logging.warning(
+                    f"{type(e).__name__} from project '{project_id}' (attempt {attempt + 1} of "
+                    f"{self.max_attempts}); retrying in {delay:.1f}s with concurrency {self.limit}."
+                )
+                time.sleep(delay)
+            except Exception:
+                self._release(throttled=False)
+                raise
+            else:
+                self._release(throttled=False)
+                return result
+
+    def _wait_for_budget(self, project_id: str):
+        if not self.interval_s:
+            return
+        with self._condition:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(project_id, now))
+            self._next_slot[project_id] = slot + self.interval_s
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _acquire(self):
+        with self._condition:
+            while self._in_flight >= self.limit:
+                self._condition.wait()
+            self._in_flight += 1
+
+    def _release(self, throttled: bool):
+        with self._condition:
+            self._in_flight -= 1
+            if throttled:
+                self.limit = max(1, self.limit // 2)
+                self._successes = 0
+            else:
+                self._successes += 1
+                if self._successes >= self.recovery_successes and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+def _prefetch(items: Iterator, depth: int) -> Iterator:
+    """
+    Iterates over `items` on a background thread that keeps up to `depth` items ready
+    ahead of the consumer (plus the one it is producing). Errors are raised in the
+    consumer; closing the consumer stops the producer after its current item.
+    """
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(entry) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        # Entries are (is_item, value); the last one carries the error, if any.
+        try:
+            for item in items:
+                if not put((True, item)):
+                    return
+            put((False, None))
+        except Exception as e:
+            put((False, e))
+
+    threading.Thread(target=produce, name="page-prefetch", daemon=True).start()
+    try:
+        while True:
+            is_item, value = buffer.get()
+            if not is_item:
+                if value is not None:
+                    raise value
+                return
+            yield value
+    finally:
+        stop.set()
+
+class ScheduledClient:
+    """
+    Wraps a MetricServiceClient so that every page of `list_time_series` is fetched
+    through a RequestScheduler. Pages are requested one call at a time (rather than
+    by the client's pager, which cannot resume after an error), so a failed page is
+    retried on its own without refetching the ones before it. The client library's
+    own retry is turned off, leaving the scheduler in charge.
+
+    `page_size` sets the page size, in points, of requests that do not set one (the
+    API default is 100,000 points). With `prefetch_pages` > 0, a background thread fetches up to
+    that many pages ahead while the caller decodes the current one, so network wait
+    and decoding overlap.
+    Other attributes are passed through to the wrapped client.
+    """
+
+    def __init__(
+        self,
+        client: monitoring_v3.MetricServiceClient,
+        scheduler: RequestScheduler,
+        page_size: Optional[int] = None,
+        prefetch_pages: int = 1,
+    ):
+        self.client = client
+        self.scheduler = scheduler
+        self.page_size = page_size
+        self.prefetch_pages = prefetch_pages
+
+    def list_time_series(self, request: monitoring_v3.ListTimeSeriesRequest = None, **kwargs) -> "ScheduledPager":
+        if self.page_size and not request.page_size:
+            request = monitoring_v3.ListTimeSeriesRequest(request)
+            request.page_size = self.page_size
+        return ScheduledPager(self, request, kwargs)
+
+    def _fetch_page(self, request: monitoring_v3.ListTimeSeriesRequest, kwargs: dict) -> monitoring_v3.ListTimeSeriesResponse:
+        # The first page of a pager is fetched by the call itself, so this is one RPC.
+        pager = self.client.list_time_series(request=request, retry=None, **kwargs)
+        return next(iter(pager.pages), monitoring_v3.ListTimeSeriesResponse())
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+class ScheduledPager:
+    """
+    The subset of ListTimeSeriesPager the query code uses: `.pages`, and iteration over
+    the time series of every page.
+    """
+
+    def __init__(self, client: ScheduledClient, request: monitoring_v3.ListTimeSeriesRequest, kwargs: dict):
+        self._client = client
+        self._request = request
+        self._kwargs = kwargs
+
+    @property
+    def pages(self) -> Iterator[monitoring_v3.ListTimeSeriesResponse]:
+        if self._client.prefetch_pages > 0:
+            return _prefetch(self._fetch_pages(), self._client.prefetch_pages)
+        return self._fetch_pages()
+
+    def _fetch_pages(self) -> Iterator[monitoring_v3.ListTimeSeriesResponse]:
+        request = monitoring_v3.ListTimeSeriesRequest(self._request)
+        project_id = request.name.split("/", 1)[-1]
+        while True:
+            response = self._client.scheduler.call(project_id, self._client._fetch_page, request, self._kwargs)
+            yield response
+            if not response.next_page_token:
+                return
+            request.page_token = response.next_page_token
+
+    def __iter__(self):
+        for page in self.pages:
+            yield from page.time_series
+
+def get_client(
+    credentials: Optional[google.auth.credentials.Credentials] = None,
+    scheduler: Optional[RequestScheduler] = None,
+    page_size: Optional[int] = None,
+    prefetch_pages: int = 1,
+) -> ScheduledClient:
+    """
+    Creates a MetricServiceClient, optionally from already loaded credentials, whose
+    requests go through `scheduler` (a default RequestScheduler if None), with the
+    given page size and page prefetch depth (see ScheduledClient). The client is
+    thread-safe and not tied to a project, so a single instance can be shared by
+    every query in a run instead of opening a channel per metric or project.
+    """
+    return ScheduledClient(
+        monitoring_v3.MetricServiceClient(credentials=credentials), scheduler or RequestScheduler(),
+        page_size, prefetch_pages,
+    )
+
+def _label_path(label: str) -> str:
+    return f'resource.label.{label}' if label in RESOURCE_LABELS else f'metric.label.{label}'
+
+def group_by_labels(metric_config: MetricConfig, group_by: Optional[List[str]] = None) -> List[str]:
+    """
+    Returns the labels a metric's series are grouped by. By default that is every
+    resource label and every configured metric label. With `group_by`, only the
+    requested labels the metric has are kept, plus project_id, and Cloud Monitoring
+    reduces over the rest with the metric's reducer.
+    """
+    known = RESOURCE_LABELS + metric_config.metric_labels
+    if group_by is None:
+        return known
+    return ['project_id'] + [label for label in known if label in group_by and label != 'project_id']
+
+def applicable_filters(metric_config: MetricConfig, filters: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    Returns the label filters that apply to a metric, dropping filters on labels it does not have.
+    """
+    known = RESOURCE_LABELS + metric_config.metric_labels
+    return {label: value for label, value in (filters or {}).items() if label in known}
+
+def _build_request(
+    project_id: str,
+    metric_config: MetricConfig,
+    start_time: datetime.datetime,
+    end_time: datetime.datetime,
+    alignment_period_s: int = ONE_DAY_S,
+    group_by: Optional[List[str]] = None,
+    filters: Optional[Dict[str, str]] = None,
+) -> monitoring_v3.ListTimeSeriesRequest:
+    """
+    Builds the ListTimeSeries request for one metric over one time interval.
+    Label filters and the group-by labels are pushed into the request, so Cloud
+    Monitoring does the filtering and reduction (see group_by_labels).
+    """
+    return _build_batch_request(
+        project_id, [metric_config], start_time, end_time, alignment_period_s, group_by, filters,
+    )
+
+def _build_batch_request(
+    project_id: str,
+    metric_configs: List[MetricConfig],
+    start_time: datetime.datetime,
+    end_time: datetime.datetime,
+    alignment_period_s: int = ONE_DAY_S,
+    group_by: Optional[List[str]] = None,
+    filters: Optional[Dict[str, str]] = None,
+) -> monitoring_v3.ListTimeSeriesRequest:
+    """
+    Builds one ListTimeSeries request for several compatible metrics (see
+    coalesce_configs), selected with a `metric.type = one_of(...)` filter.
+    The series are also grouped by metric.type, so the reducer never combines
+    series of different metrics. A single metric gets a plain single-metric request.
+    """
+    first = metric_configs[0]
+
+    # 1. Define Time Interval
+    interval = monitoring_v3.TimeInterval(start_time=start_time, end_time=end_time)
+
+    # 2. Define Metric Filter
+    if len(metric_configs) == 1:
+        metric_filter = f'metric.type = "{first.metric_type}"'
+    else:
+        metric_types = ", ".join(f'"{config.metric_type}"' for config in metric_configs)
+        metric_filter = f'metric.type = one_of({metric_types})'
+    for label, value in applicable_filters(first, filters).items():
+        escaped = value.replace('\\', '\\\\').replace('"', '\\"')
+        metric_filter += f' AND {_label_path(label)} = "{escaped}"'
+
+    # 3. Define Aggregation
+    
+    aligner = getattr(monitoring_v3.Aggregation.Aligner, first.aligner)
+    reducer = getattr(monitoring_v3.Aggregation.Reducer, first.reducer)
+
+    # Labels are grouped by if any metric of the batch has them. A metric's series
+    # have no value for another metric's labels, so this does not split them further.
+    labels = list(dict.fromkeys(
+        label for config in metric_configs for label in group_by_labels(config, group_by)
+    ))
+    group_by_fields = [_label_path(label) for label in labels]
+    if len(metric_configs) > 1:
+        group_by_fields.insert(0, "metric.type")
+
+    aggregation = monitoring_v3.Aggregation(
+        alignment_period=duration_pb2.Duration(seconds=alignment_period_s),
+        per_series_aligner=aligner,
+        cross_series_reducer=reducer,
+        group_by_fields=group_by_fields,
+    )
+
+    return monitoring_v3.ListTimeSeriesRequest(
+        name=f"projects/{project_id}",
+        filter=metric_filter,
+        interval=interval,
+        aggregation=aggregation,
+        view=monitoring_v3.ListTimeSeriesRequest.TimeSeriesView.FULL,
+    )
+
+def _fetch_frame(
+    client: monitoring_v3.MetricServiceClient,
+    request: monitoring_v3.ListTimeSeriesRequest,
+    metric_config: MetricConfig,
+    label_offset_s: int = 0,
+    tz: Optional[datetime.tzinfo] = None,
+    with_time: bool = False,
+    histogram: bool = False,
+) -> pd.DataFrame:
+    """
+    Sends a request and decodes the returned time series into one row per point.
+    Each point is labelled with the date (or, with `with_time`, the date and time)
+    of its end time minus `label_offset_s`, in `tz` (local time if None).
+    """
+    return _fetch_frames(
+        client, request, [metric_config],
+        label_offset_s=label_offset_s, tz=tz, with_time=with_time, histogram=histogram,
+    )[metric_config.name]
+
+def _fetch_frames(
+    client: monitoring_v3.MetricServiceClient,
+    request: monitoring_v3.ListTimeSeriesRequest,
+    metric_configs: List[MetricConfig],
+    label_offset_s: int = 0,
+    tz: Optional[datetime.tzinfo] = None,
+    with_time: bool = False,
+    histogram: bool = False,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Sends a request for one or more metrics and decodes the returned series into one
+    frame per metric, splitting them by metric type (see _fetch_frame).
+    """
+    api_label = ",".join(config.name for config in metric_configs)
+    pages = _page_series(client.list_time_series(request=request).pages, api_label)
+    decode = functools.partial(
+        decode_time_series, label_offset_s=label_offset_s, tz=tz, with_time=with_time, histogram=histogram,
+    )
+
+    frames = {}
+    if len(metric_configs) == 1:
+        # Decoding consumes each page as it arrives, while the next ones are prefetched.
+        config = metric_configs[0]
+        page_sizes = []
+
+        def series():
+            for page_series in pages:
+                page_sizes.append(len(page_series))
+                yield from page_series
+
+        with instrumentation.span("decode", config.name):
+            frames[config.name] = decode(series(), config)
+        instrumentation.count("series_decoded", sum(page_sizes), config.name)
+        instrumentation.count("points_decoded", len(frames[config.name]), config.name)
+        return frames
+
+    series_by_type = {config.metric_type: [] for config in metric_configs}
+    for page_series in pages:
+        for time_series in page_series:
+            series_by_type[time_series.metric.type].append(time_series)
+    for config in metric_configs:
+        series = series_by_type[config.metric_type]
+        with instrumentation.span("decode", config.name):
+            frames[config.name] = decode(series, config)
+        instrumentation.count("series_decoded", len(series), config.name)
+        instrumentation.count("points_decoded", len(frames[config.name]), config.name)
+    return frames
+
+def _page_series(pages: Iterator[monitoring_v3.ListTimeSeriesResponse], api_label: str) -> Iterator:
+    """
+    Yields the raw time series of each page, recording the time spent waiting for
+    each page as the `api` phase and counting the pages.
+    """
+    pages = iter(pages)
+    page_count = 0
+    while True:
+        with instrumentation.span("api", api_label):
+            page = next(pages, None)
+        if page is None:
+            break
+        page_count += 1
+        yield monitoring_v3.ListTimeSeriesResponse.pb(page).time_series
+    instrumentation.count("pages_fetched", page_count, api_label)
+
+def _chunk_interval(
+    start_time: datetime.datetime,
+    end_time: datetime.datetime,
+    alignment_period_s: int,
+) -> List[Tuple[datetime.datetime, datetime.datetime]]:
+    """
+    Splits a time interval into consecutive chunks of at most CHUNK_POINTS alignment
+    periods. Chunks are measured back from `end_time`, so every chunk boundary falls
+    on the same alignment grid as a single request over the whole interval would.
+    """
+    span = datetime.timedelta(seconds=alignment_period_s * CHUNK_POINTS)
+    chunks = []
+    chunk_end = end_time
+    while chunk_end > start_time:
+        chunk_start = max(start_time, chunk_end - span)
+        chunks.append((chunk_start, chunk_end))
+        chunk_end = chunk_start
+    return chunks[::-1]
+
+def _stitch_frames(frames: List[pd.DataFrame], metric_config: MetricConfig) -> pd.DataFrame:
+    """
+    Concatenates chunk results in order, dropping points repeated on chunk boundaries.
+    """
+    frames = [df for df in frames if not df.empty]
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0]
+    df = pd.concat(frames, ignore_index=True)
+    point_key = [col for col in df.columns if col != metric_config.value_name and not is_histogram_column(col)]
+    return df.drop_duplicates(subset=point_key, keep="last").reset_index(drop=True)
+
+def _fetch_interval(
+    client: monitoring_v3.MetricServiceClient,
+    build_request: Callable[..., monitoring_v3.ListTimeSeriesRequest],
+    metric_config: MetricConfig,
+    start_time: datetime.datetime,
+    end_time: datetime.datetime,
+    alignment_period_s: int = ONE_DAY_S,
+    max_concurrency: int = 1,
+    label_offset_s: int = 0,
+    tz: Optional[datetime.tzinfo] = None,
+    histogram: bool = False,
+    checkpoint: Optional[Checkpoint] = None,
+    checkpoint_key: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Fetches a metric over an interval, splitting long windows into chunks that are
+    requested in parallel (up to `max_concurrency` at once) and stitched back in order.
+    `build_request(start_time, end_time, alignment_period_s)` builds each chunk's request.
+    With a `checkpoint`, each chunk of a split window is stored under `checkpoint_key`
+    once fetched, and chunks stored by an earlier run are loaded instead of fetched.
+    """
+    return _fetch_batch_interval(
+        client, build_request, [metric_config], start_time, end_time,
+        alignment_period_s, max_concurrency, label_offset_s, tz, histogram,
+        checkpoint, checkpoint_key,
+    )[metric_config.name]
+
+def _fetch_batch_interval(
+    client: monitoring_v3.MetricServiceClient,
+    build_request: Callable[..., monitoring_v3.ListTimeSeriesRequest],
+    metric_configs: List[MetricConfig],
+    start_time: datetime.datetime,
+    end_time: datetime.datetime,
+    alignment_period_s: int = ONE_DAY_S,
+    max_concurrency: int = 1,
+    label_offset_s: int = 0,
+    tz: Optional[datetime.tzinfo] = None,
+    histogram: bool = False,
+    checkpoint: Optional[Checkpoint] = None,
+    checkpoint_key: Optional[str] = None,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Like _fetch_interval, for a batch of metrics fetched with shared requests.
+    Returns one stitched frame per metric name.
+    """
+    chunks = _chunk_interval(start_time, end_time, alignment_period_s)
+    with_time = alignment_period_s < ONE_DAY_S
+    # A window fetched in one request is checkpointed as a whole by the caller.
+    if len(chunks) <= 1:
+        checkpoint = None
+
+    def fetch_chunk(chunk):
+        if checkpoint is not None:
+            key = chunk_key(checkpoint_key, chunk[0], chunk[1])
+            frames = checkpoint.load(CHUNKS, key)
+            if frames is not None:
+                return frames
+        request = build_request(chunk[0], chunk[1], alignment_period_s)
+        frames = _fetch_frames(
+            client, request, metric_configs,
+            label_offset_s=label_offset_s, tz=tz, with_time=with_time, histogram=histogram,
+        )
+        if checkpoint is not None:
+            checkpoint.save(CHUNKS, key, frames)
+        return frames
+
+    if len(chunks) <= 1:
+        results = [fetch_chunk(chunk) for chunk in chunks]
+    else:
+        names = ", ".join(config.metric_type for config in metric_configs)
+        logging.info(f"Fetching {names} in {len(chunks)} chunks...")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+            results = list(executor.map(fetch_chunk, chunks))
+    return {
+        config.name: _stitch_frames([frames[config.name] for frames in results], config)
+        for config in metric_configs
+    }
+
+def _order_frame(df: pd.DataFrame, metric_config: MetricConfig) -> pd.DataFrame:
+    """
+    Puts the columns in display order and sorts the rows by date and resource labels.
+    """
+    # Get all columns from the DataFrame
+    all_cols = df.columns.tolist()
+    
+    # Start the final order with preferred columns that exist in the DataFrame
+    final_ordered_cols = [col for col in PREFERRED_ORDER if col in all_cols]
+    
+    # Get the remaining label columns (not preferred, not the value or histogram columns)
+    value_col = metric_config.value_name
+    histogram_cols = [col for col in all_cols if is_histogram_column(col)]
+    remaining_labels = [
+        col for col in all_cols 
+        if col not in final_ordered_cols and col != value_col and col not in histogram_cols
+    ]
+    remaining_labels.sort() # Sort the rest alphabetically for consistency
+    
+    # Combine the lists to get the final column order
+    final_ordered_cols.extend(remaining_labels)
+    final_ordered_cols.append(value_col)
+    final_ordered_cols.extend(histogram_cols)
+    
+    # Reorder the DataFrame
+    df = df[final_ordered_cols]
+    
+    # Define sorting order, respecting the new visual hierarchy
+    sorting_cols = [col for col in PREFERRED_ORDER if col in df.columns]
+    
+    return df.sort_values(by=sorting_cols).reset_index(drop=True)
+
+def _day_runs(days: List[datetime.date]) -> List[Tuple[datetime.date, datetime.date]]:
+    """
+    Collapses a sorted list of days into (first, last) runs of consecutive days.
+    """
+    runs = []
+    for day in days:
+        if runs and (day - runs[-1][1]).days == 1:
+            runs[-1] = (runs[-1][0], day)
+        else:
+            runs.append((day, day))
+    return runs
+
+def _utc_midnight(day: datetime.date) -> datetime.datetime:
+    return datetime.datetime.combine(day, datetime.time.min, tzinfo=datetime.timezone.utc)
+
+def _floor_time(moment: datetime.datetime, period_s: int) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(int(moment.timestamp()) // period_s * period_s, datetime.timezone.utc)
+
+def _query_with_cache(
+    client: monitoring_v3.MetricServiceClient,
+    cache: MetricCache,
+    project_id: str,
+    config_key: str,
+    build_request: Callable[..., monitoring_v3.ListTimeSeriesRequest],
+    metric_config: MetricConfig,
+    start_time: datetime.datetime,
+    end_time: datetime.datetime,
+    alignment_period_s: int = ONE_DAY_S,
+    max_concurrency: int = 1,
+    histogram: bool = False,
+    checkpoint: Optional[Checkpoint] = None,
+    checkpoint_key: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Fetches a metric as whole UTC calendar days, reading closed days from the cache
+    and requesting only the missing ones plus the still-open current day.
+    Points are labelled with the start of the period they cover rather than its end.
+    With a `checkpoint`, "now" is the checkpointed run's start time, and the chunks
+    of long fetches are checkpointed as in _fetch_interval.
+    """
+    now = checkpoint.now if checkpoint is not None else datetime.datetime.now(datetime.timezone.utc)
+    today = now.date()
+    first_day = start_time.astimezone(datetime.timezone.utc).date()
+    last_day = end_time.astimezone(datetime.timezone.utc).date()
+    closed_days = [
+        first_day + datetime.timedelta(days=n)
+        for n in range((min(last_day, today - datetime.timedelta(days=1)) - first_day).days + 1)
+    ]
+    utc = datetime.timezone.utc
+
+    cached_days = cache.cached_days(project_id, config_key, closed_days)
+    frames = [cache.load(project_id, config_key, cached_days, with_time=alignment_period_s < ONE_DAY_S)]
+    missing_days = [day for day in closed_days if day not in cached_days]
+    logging.info(
+        f"Cache: {len(cached_days)} of {len(closed_days)} closed day(s) of {metric_config.metric_type} "
+        f"already stored; fetching {len(missing_days)}."
+    )
+
+    for run_start, run_end in _day_runs(missing_days):
+        df = _fetch_interval(
+            client, build_request, metric_config,
+            _utc_midnight(run_start), _utc_midnight(run_end + datetime.timedelta(days=1)),
+            alignment_period_s, max_concurrency, label_offset_s=alignment_period_s, tz=utc, histogram=histogram,
+            checkpoint=checkpoint, checkpoint_key=checkpoint_key,
+        )
+        # Late-arriving points can still change a day that ended moments ago.
+        settled_days = [
+            run_start + datetime.timedelta(days=n)
+            for n in range((run_end - run_start).days + 1)
+            if _utc_midnight(run_start + datetime.timedelta(days=n + 1)) <= now - datetime.timedelta(seconds=CACHE_SETTLE_S)
+        ]
+        cache.store(project_id, config_key, metric_config.name, df, settled_days)
+        frames.append(df)
+
+    if last_day >= today:
+        frames.append(_fetch_until_now(
+            client, build_request, metric_config, _utc_midnight(today), now,
+            alignment_period_s, max_concurrency, histogram, checkpoint, checkpoint_key,
+        ))
+
+    return _stitch_frames(frames, metric_config)
+
+def _fetch_until_now(
+    client: monitoring_v3.MetricServiceClient,
+    build_request: Callable[..., monitoring_v3.ListTimeSeriesRequest],
+    metric_config: MetricConfig,
+    start_time: datetime.datetime,
+    now: datetime.datetime,
+    alignment_period_s: int = ONE_DAY_S,
+    max_concurrency: int = 1,
+    histogram: bool = False,
+    checkpoint: Optional[Checkpoint] = None,
+    checkpoint_key: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Fetches the UTC-aligned periods from `start_time` (a period boundary) until `now`:
+    the complete periods, followed by one partial period that runs until now.
+    Points are labelled with the start of the period they cover. The complete
+    periods are checkpointed as in _fetch_interval.
+    """
+    utc = datetime.timezone.utc
+    frames = []
+    grid_end = max(start_time, _floor_time(now, alignment_period_s))
+    if grid_end > start_time:
+        frames.append(_fetch_interval(
+            client, build_request, metric_config, start_time, grid_end,
+            alignment_period_s, max_concurrency, label_offset_s=alignment_period_s, tz=utc, histogram=histogram,
+            checkpoint=checkpoint, checkpoint_key=checkpoint_key,
+        ))
+    partial_s = int((now - grid_end).total_seconds())
+    if partial_s >= MIN_ALIGNMENT_PERIOD_S:
+        request = build_request(grid_end, now, partial_s)
+        frames.append(_fetch_frame(
+            client, request, metric_config,
+            label_offset_s=partial_s, tz=utc, with_time=alignment_period_s < ONE_DAY_S, histogram=histogram,
+        ))
+    return _stitch_frames(frames, metric_config)
+
+def fetch_metric_since(
+    project_id: str,
+    metric_config: MetricConfig,
+    since: datetime.datetime,
+    client: monitoring_v3.MetricServiceClient,
+    now: Optional[datetime.datetime] = None,
+    alignment_period_s: int = ONE_DAY_S,
+    max_concurrency: int = 1,
+    histogram: bool = False,
+    group_by: Optional[List[str]] = None,
+    filters: Optional[Dict[str, str]] = None,
+) -> pd.DataFrame:
+    """
+    Fetches a metric from `since` until `now` on the UTC-aligned grid used by the
+    cache, so repeated calls return the same periods with the same labels: every
+    complete period, plus the still-open current period. `since` is rounded down to
+    a period boundary, and each point is labelled with the start of its period.
+    API errors are raised as they are, not wrapped in MetricQueryError.
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    build_request = functools.partial(
+        _build_request, project_id, metric_config, group_by=group_by, filters=filters,
+    )
+    df = _fetch_until_now(
+        client, build_request, metric_config, _floor_time(since, alignment_period_s), now,
+        alignment_period_s, max_concurrency, histogram,
+    )
+    if df.empty:
+        return df
+    with instrumentation.span("sort", metric_config.name):
+        return _order_frame(df, metric_config)
 
 def query_metric(
     project_id: str,
     metric_config: MetricConfig,
     days_ago_start: int = 90,
     days_ago_end: int = 0,
+    client: Optional[monitoring_v3.MetricServiceClient] = None,
+    cache: Optional[MetricCache] = None,
+    alignment_period_s: int = ONE_DAY_S,
+    max_concurrency: int = 1,
+    histogram: bool = False,
+    group_by: Optional[List[str]] = None,
+    filters: Optional[Dict[str, str]] = None,
+    checkpoint: Optional[Checkpoint] = None,
 ) -> pd.DataFrame:
     """
     Retrieves and processes a specified metric from Google Cloud Monitoring.
+    If no client is given, a new one is created for this query.
+    If a cache is given, the window is widened to whole UTC days and only days
+    missing from the cache (plus the current day) are requested from the API.
+    With an alignment period shorter than a day, the `date` column holds the date
+    and time of each point, and long windows are fetched as parallel chunks.
+    With `histogram` set, distribution metrics also return their bucket counts and
+    sample sums as `hist_` columns (see monitor.histograms).
+    `filters` ({label: value}) and `group_by` (label names) are applied by Cloud
+    Monitoring; filters on labels the metric does not have are ignored.
+    With a `checkpoint`, the window is measured back from the checkpointed run's
+    start time, and the chunks of a long window are checkpointed as they arrive,
+    with or without the cache.
+    A query that fails (after the client's retries, see RequestScheduler) is logged
+    and raised as MetricQueryError; an empty DataFrame always means "no data".
     """
     try:
-        client = monitoring_v3.MetricServiceClient()
-        project_name = f"projects/{project_id}"
+        if client is None:
+            client = get_client()
 
-        # 1. Define Time Interval
-        now = datetime.datetime.now(datetime.timezone.utc)
+        now = checkpoint.now if checkpoint is not None else datetime.datetime.now(datetime.timezone.utc)
         end_time = now - datetime.timedelta(days=days_ago_end)
         start_time = now - datetime.timedelta(days=days_ago_start)
-        interval = monitoring_v3.TimeInterval(start_time=start_time, end_time=end_time)
-
-        # 2. Define Metric Filter
-        metric_filter = f'metric.type = "{metric_config.metric_type}"'
 
-        # 3. Define Aggregation
-        ONE_DAY_S = 86400
-        
-        resource_labels = [
-            'resource.label.project_id', 'resource.label.location',
-            'resource.label.publisher', 'resource.label.model_version_id',
-            'resource.label.model_user_id',
-        ]
-        metric_labels = [f'metric.label.{label}' for label in metric_config.metric_labels]
-        
-        aligner = getattr(monitoring_v3.Aggregation.Aligner, metric_config.aligner)
-        reducer = getattr(monitoring_v3.Aggregation.Reducer, metric_config.reducer)
-
-        aggregation = monitoring_v3.Aggregation(
-            alignment_period=duration_pb2.Duration(seconds=ONE_DAY_S),
-            per_series_aligner=aligner,
-            cross_series_reducer=reducer,
-            group_by_fields=resource_labels + metric_labels,
-        )
-
-        # 4. Create and Send the Request
         logging.info(f"Querying metric: {metric_config.metric_type} from {start_time.date()} to {end_time.date()}...")
-        request = monitoring_v3.ListTimeSeriesRequest(
-            name=project_name,
-            filter=metric_filter,
-            interval=interval,
-            aggregation=aggregation,
-            view=monitoring_v3.ListTimeSeriesRequest.TimeSeriesView.FULL,
+        build_request = functools.partial(
+            _build_request, project_id, metric_config, group_by=group_by, filters=filters,
         )
-        results = client.list_time_series(request=request)
-
-        # 5. Process and Format Results
-        data = []
-        for time_series in results:
-            row = {label: value for label, value in time_series.resource.labels.items()}
-            row.update({label: value for label, value in time_series.metric.labels.items()})
-
-            for point in time_series.points:
-                point_row = row.copy()
-                ts_seconds = point.interval.end_time.timestamp()
-                point_row["date"] = datetime.datetime.fromtimestamp(ts_seconds).date()
-                
-                value = getattr(point.value, metric_config.value_field, None)
-                if metric_config.value_field == "distribution_value" and value:
-                    point_row[metric_config.value_name] = value.count
-                else:
-                    point_row[metric_config.value_name] = value
-
-                data.append(point_row)
-
-        if not data:
+        if cache is not None:
+            config_key = cache.config_key(
+                metric_config, alignment_period_s=alignment_period_s, histogram=histogram,
+                group_by=group_by_labels(metric_config, group_by),
+                filters=applicable_filters(metric_config, filters),
+            )
+            df = _query_with_cache(
+                client, cache, project_id, config_key, build_request, metric_config, start_time, end_time,
+                alignment_period_s, max_concurrency, histogram,
+                checkpoint, unit_key(project_id, [metric_config]),
+            )
+        else:
+            df = _fetch_interval(
+                client, build_request, metric_config, start_time, end_time,
+                alignment_period_s, max_concurrency, histogram=histogram,
+                checkpoint=checkpoint, checkpoint_key=unit_key(project_id, [metric_config]),
+            )
+
+        if df.empty:
             logging.warning("No data found for the specified period.")
             return pd.DataFrame()
 
-        df = pd.DataFrame(data)
-        
-        # Define the desired fixed order for the initial columns
-        preferred_order = ['date', 'location', 'project_id', 'model_user_id', 'model_version_id']
-        
-        # Get all columns from the DataFrame
-        all_cols = df.columns.tolist()
-        
-        # Start the final order with preferred columns that exist in the DataFrame
-        final_ordered_cols = [col for col in preferred_order if col in all_cols]
-        
-        # Get the remaining label columns (not preferred, not the value column)
-        value_col = metric_config.value_name
-        remaining_labels = [
-            col for col in all_cols 
-            if col not in final_ordered_cols and col != value_col
-        ]
-        remaining_labels.sort() # Sort the rest alphabetically for consistency
-        
-        # Combine the lists to get the final column order
-        final_ordered_cols.extend(remaining_labels)
-        final_ordered_cols.append(value_col)
-        
-        # Reorder the DataFrame
-        df = df[final_ordered_cols]
-        
-        # Define sorting order, respecting the new visual hierarchy
-        sorting_cols = [col for col in preferred_order if col in df.columns]
-        
-        return df.sort_values(by=sorting_cols).reset_index(drop=True)
+        with instrumentation.span("sort", metric_config.name):
+            return _order_frame(df, metric_config)
+
+    except Exception as e:
+        raise _query_error(project_id, [metric_config], e) from e
 
-    except exceptions.PermissionDenied as e:
+def _query_error(project_id: str, metric_configs: List[MetricConfig], error: Exception) -> MetricQueryError:
+    """
+    Logs a failed query and returns the MetricQueryError to raise for it.
+    """
+    if isinstance(error, exceptions.PermissionDenied):
         logging.error(f"Permission denied for project '{project_id}'. Check your authentication and IAM roles.")
-        logging.error(f"Details: {e}")
-    except exceptions.GoogleAPICallError as e:
-        logging.error(f"An API error occurred: {e}")
+        logging.error(f"Details: {error}")
+    elif isinstance(error, exceptions.GoogleAPICallError):
+        logging.error(f"An API error occurred: {error}")
+    else:
+        logging.error(f"An unexpected error occurred: {error}")
+    return MetricQueryError(project_id, [config.name for config in metric_configs], str(error))
+
+def coalesce_configs(
+    metric_configs: List[MetricConfig],
+    group_by: Optional[Dict[str, List[str]]] = None,
+    filters: Optional[Dict[str, str]] = None,
+) -> List[List[MetricConfig]]:
+    """
+    Partitions metric configs into batches that can share one request: the same
+    value type, aligner and reducer, the same requested group-by labels and the
+    same applicable label filters. Batches keep the order of `metric_configs`.
+    """
+    batches: Dict[tuple, List[MetricConfig]] = {}
+    for config in metric_configs:
+        requested = (group_by or {}).get(config.name)
+        key = (
+            config.value_field,
+            config.aligner,
+            config.reducer,
+            tuple(requested) if requested is not None else None,
+            tuple(sorted(applicable_filters(config, filters).items())),
+        )
+        batches.setdefault(key, []).append(config)
+    return list(batches.values())
+
+def query_metric_batch(
+    project_id: str,
+    metric_configs: List[MetricConfig],
+    days_ago_start: int = 90,
+    days_ago_end: int = 0,
+    client: Optional[monitoring_v3.MetricServiceClient] = None,
+    alignment_period_s: int = ONE_DAY_S,
+    max_concurrency: int = 1,
+    histogram: bool = False,
+    group_by: Optional[List[str]] = None,
+    filters: Optional[Dict[str, str]] = None,
+    checkpoint: Optional[Checkpoint] = None,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Retrieves several compatible metrics (one batch of coalesce_configs) with a
+    single request per time chunk, and splits the series back into one DataFrame
+    per metric name, each as query_metric would return it.
+    """
+    if len(metric_configs) == 1:
+        config = metric_configs[0]
+        return {config.name: query_metric(
+            project_id, config, days_ago_start, days_ago_end, client, None,
+            alignment_period_s, max_concurrency, histogram, group_by, filters, checkpoint,
+        )}
+    try:
+        if client is None:
+            client = get_client()
+
+        now = checkpoint.now if checkpoint is not None else datetime.datetime.now(datetime.timezone.utc)
+        end_time = now - datetime.timedelta(days=days_ago_end)
+        start_time = now - datetime.timedelta(days=days_ago_start)
+
+        names = ", ".join(config.name for config in metric_configs)
+        logging.info(f"Querying metrics: {names} in one request from {start_time.date()} to {end_time.date()}...")
+        build_request = functools.partial(
+            _build_batch_request, project_id, metric_configs, group_by=group_by, filters=filters,
+        )
+        frames = _fetch_batch_interval(
+            client, build_request, metric_configs, start_time, end_time,
+            alignment_period_s, max_concurrency, histogram=histogram,
+            checkpoint=checkpoint, checkpoint_key=unit_key(project_id, metric_configs),
+        )
+
+        results = {}
+        for config in metric_configs:
+            df = frames[config.name]
+            if df.empty:
+                logging.warning(f"No data found for {config.name} in the specified period.")
+                results[config.name] = pd.DataFrame()
+                continue
+            with instrumentation.span("sort", config.name):
+                results[config.name] = _order_frame(df, config)
+        return results
+
     except Exception as e:
-        logging.error(f"An unexpected error occurred: {e}")
-    
-    return pd.DataFrame()
+        raise _query_error(project_id, metric_configs, e) from e
+
+def stream_columns(metric_config: MetricConfig, group_by: Optional[List[str]] = None) -> List[str]:
+    """
+    Returns the fixed column schema of a metric's rows, derived from its configured
+    labels rather than from the data, so it is known before the first page arrives.
+    """
+    labels = group_by_labels(metric_config, group_by)
+    preferred = [col for col in PREFERRED_ORDER if col == 'date' or col in labels]
+    remaining = sorted(label for label in labels if label not in preferred)
+    return preferred + remaining + [metric_config.value_name]
+
+def iter_metric_pages(
+    project_id: str,
+    metric_config: MetricConfig,
+    days_ago_start: int = 90,
+    days_ago_end: int = 0,
+    client: Optional[monitoring_v3.MetricServiceClient] = None,
+    alignment_period_s: int = ONE_DAY_S,
+    group_by: Optional[List[str]] = None,
+    filters: Optional[Dict[str, str]] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Retrieves a metric page by page, yielding each decoded page as soon as it arrives.
+    Every yielded DataFrame has the columns of `stream_columns(metric_config, group_by)`; rows are
+    in API order, not sorted; long windows are requested one chunk after another.
+    Errors are logged and raised as MetricQueryError, as in query_metric.
+    """
+    try:
+        if client is None:
+            client = get_client()
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        end_time = now - datetime.timedelta(days=days_ago_end)
+        start_time = now - datetime.timedelta(days=days_ago_start)
+
+        logging.info(f"Streaming metric: {metric_config.metric_type} from {start_time.date()} to {end_time.date()}...")
+        columns = stream_columns(metric_config, group_by)
+        with_time = alignment_period_s < ONE_DAY_S
+        for chunk_start, chunk_end in _chunk_interval(start_time, end_time, alignment_period_s):
+            request = _build_request(
+                project_id, metric_config, chunk_start, chunk_end, alignment_period_s, group_by, filters,
+            )
+            for page in client.list_time_series(request=request).pages:
+                series = monitoring_v3.ListTimeSeriesResponse.pb(page).time_series
+                with instrumentation.span("decode", metric_config.name):
+                    df = decode_time_series(series, metric_config, with_time=with_time)
+                instrumentation.count("pages_fetched", 1, metric_config.name)
+                instrumentation.count("series_decoded", len(series), metric_config.name)
+                instrumentation.count("points_decoded", len(df), metric_config.name)
+                if not df.empty:
+                    yield df.reindex(columns=columns)
+
+    except Exception as e:
+        raise _query_error(project_id, [metric_config], e) from e
+
+def _merge_projects(frames: List[pd.DataFrame], metric_config: MetricConfig) -> pd.DataFrame:
+    """
+    Merges the results of one metric across projects into a single ordered frame.
+    """
+    frames = [df for df in frames if not df.empty]
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0]
+    return _order_frame(pd.concat(frames, ignore_index=True), metric_config)
+
+def iter_query_metrics(
+    project_id: Union[str, Sequence[str]],
+    metric_configs: List[MetricConfig],
+    days_ago_start: int = 90,
+    days_ago_end: int = 0,
+    max_concurrency: int = 1,
+    client: Optional[monitoring_v3.MetricServiceClient] = None,
+    cache: Optional[MetricCache] = None,
+    alignment_period_s: int = ONE_DAY_S,
+    histogram: bool = False,
+    group_by: Optional[Dict[str, List[str]]] = None,
+    filters: Optional[Dict[str, str]] = None,
+    coalesce: bool = True,
+    errors: Optional[Dict[str, MetricQueryError]] = None,
+    checkpoint: Optional[Checkpoint] = None,
+) -> Iterator[Tuple[str, pd.DataFrame]]:
+    """
+    Like query_metrics, but yields (metric name, DataFrame) pairs as soon as every
+    project of a metric has been fetched, in completion order, so callers can start
+    working on one metric while the others are still being fetched.
+    With `coalesce` (and no cache), compatible metrics share one request per
+    project and time chunk (see coalesce_configs), which cuts round trips and quota.
+    A failed query raises MetricQueryError, unless an `errors` dict is given: then
+    the error is recorded there under each metric name, and the metric is yielded
+    with the data of the projects that succeeded.
+    With a `checkpoint`, each batch is stored once fetched for a project, and
+    batches stored by an earlier run of the same query are loaded instead of fetched.
+    """
+    project_ids = [project_id] if isinstance(project_id, str) else list(project_id)
+    if client is None:
+        client = get_client()
+
+    # Cached queries are stored per metric, so they are never coalesced.
+    if coalesce and cache is None:
+        batches = coalesce_configs(metric_configs, group_by, filters)
+    else:
+        batches = [[config] for config in metric_configs]
+
+    def fetch(batch: List[MetricConfig], project: str) -> Dict[str, pd.DataFrame]:
+        if checkpoint is not None:
+            results = checkpoint.load(UNITS, unit_key(project, batch))
+            if results is not None:
+                logging.info(f"Loaded {', '.join(config.name for config in batch)} for {project} from the checkpoint.")
+                return results
+        batch_group_by = (group_by or {}).get(batch[0].name)
+        if len(batch) > 1:
+            results = query_metric_batch(
+                project, batch, days_ago_start, days_ago_end, client,
+                alignment_period_s, max_concurrency, histogram, batch_group_by, filters, checkpoint,
+            )
+        else:
+            results = {batch[0].name: query_metric(
+                project, batch[0], days_ago_start, days_ago_end, client, cache,
+                alignment_period_s, max_concurrency, histogram, batch_group_by, filters, checkpoint,
+            )}
+        if checkpoint is not None:
+            checkpoint.save(UNITS, unit_key(project, batch), results)
+        return results
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+        futures = {
+            executor.submit(fetch, batch, project): (batch, project)
+            for batch in batches
+            for project in project_ids
+        }
+
+        pending = {config.name: {} for config in metric_configs}
+        for future in concurrent.futures.as_completed(futures):
+            batch, project = futures[future]
+            try:
+                results = future.result()
+            except MetricQueryError as e:
+                if errors is None:
+                    raise
+                results = {config.name: pd.DataFrame() for config in batch}
+                for config in batch:
+                    errors.setdefault(config.name, e)
+            for config in batch:
+                frames = pending[config.name]
+                frames[project] = results[config.name]
+                if len(frames) == len(project_ids):
+                    yield config.name, _merge_projects([frames[project] for project in project_ids], config)
+
+def query_metrics(
+    project_id: Union[str, Sequence[str]],
+    metric_configs: List[MetricConfig],
+    days_ago_start: int = 90,
+    days_ago_end: int = 0,
+    max_concurrency: int = 1,
+    client: Optional[monitoring_v3.MetricServiceClient] = None,
+    cache: Optional[MetricCache] = None,
+    alignment_period_s: int = ONE_DAY_S,
+    histogram: bool = False,
+    group_by: Optional[Dict[str, List[str]]] = None,
+    filters: Optional[Dict[str, str]] = None,
+    coalesce: bool = True,
+    errors: Optional[Dict[str, MetricQueryError]] = None,
+    checkpoint: Optional[Checkpoint] = None,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Queries several metrics, in one or more projects, over one shared client, running
+    up to `max_concurrency` requests at once. The returned dict is keyed by metric name
+    and always follows the order of `metric_configs`, regardless of which request
+    finishes first. With several projects, each metric's results are merged into one
+    frame in which `project_id` distinguishes the projects.
+    `group_by` maps metric names to the labels to keep for that metric; metrics
+    not in it keep all their labels.
+    """
+    results = dict(iter_query_metrics(
+        project_id, metric_configs, days_ago_start, days_ago_end, max_concurrency,
+        client, cache, alignment_period_s, histogram, group_by, filters, coalesce, errors, checkpoint,
+    ))
+    return {config.name: results[config.name] for config in metric_configs}
+
+def query_wide(
+    project_id: Union[str, Sequence[str]],
+    metric_configs: List[MetricConfig],
+    days_ago_start: int = 90,
+    days_ago_end: int = 0,
+    max_concurrency: int = 1,
+    client: Optional[monitoring_v3.MetricServiceClient] = None,
+    cache: Optional[MetricCache] = None,
+    alignment_period_s: int = ONE_DAY_S,
+    filters: Optional[Dict[str, str]] = None,
+    coalesce: bool = True,
+    errors: Optional[Dict[str, MetricQueryError]] = None,
+    checkpoint: Optional[Checkpoint] = None,
+) -> pd.DataFrame:
+    """
+    Queries several metrics together and returns them as one wide frame indexed by
+    (date, project_id, location, model_user_id), with a value column per metric and
+    utilisation ratios for the usage/limit pairs present (see monitor.wide).
+    Every metric is grouped by the index labels in the request, so Cloud Monitoring
+    reduces over the others and little more than the index comes back.
+    """
+    frames = query_metrics(
+        project_id, metric_configs, days_ago_start, days_ago_end, max_concurrency,
+        client, cache, alignment_period_s,
+        group_by={config.name: WIDE_LABELS for config in metric_configs},
+        filters=filters, coalesce=coalesce, errors=errors, checkpoint=checkpoint,
+    )
+    with instrumentation.span("align"):
+        return align_wide(frames, metric_configs, alignment_period_s)
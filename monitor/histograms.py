@@ -0,0 +1,109 @@
+from typing import List, Sequence
+
+import numpy as np
+import pandas as pd
+
+# Histogram data travels in ordinary DataFrame columns, so it survives sorting,
+# filtering, concatenation and the cache. Bucket columns are named after their
+# upper bound (Prometheus style), which makes the bucket layout self-describing.
+HISTOGRAM_PREFIX = "hist_"
+BUCKET_PREFIX = "hist_le_"
+SUM_COLUMN = "hist_sum"
+
+def bucket_bounds(bucket_options) -> np.ndarray:
+    """
+    Returns the finite bucket boundaries of a raw `google.api.Distribution.BucketOptions`.
+    N boundaries describe N + 1 buckets, including the underflow and overflow buckets.
+    """
+    kind = bucket_options.WhichOneof("options")
+    if kind == "linear_buckets":
+        layout = bucket_options.linear_buckets
+        return layout.offset + layout.width * np.arange(layout.num_finite_buckets + 1, dtype=np.float64)
+    if kind == "exponential_buckets":
+        layout = bucket_options.exponential_buckets
+        return layout.scale * layout.growth_factor ** np.arange(layout.num_finite_buckets + 1, dtype=np.float64)
+    if kind == "explicit_buckets":
+        return np.array(bucket_options.explicit_buckets.bounds, dtype=np.float64)
+    return np.array([], dtype=np.float64)
+
+def bucket_columns(bounds: Sequence[float]) -> List[str]:
+    """
+    Returns the column names of the buckets described by `bounds`, ending with +Inf.
+    """
+    return [f"{BUCKET_PREFIX}{float(bound)!r}" for bound in list(bounds) + [np.inf]]
+
+def is_histogram_column(column: str) -> bool:
+    return isinstance(column, str) and column.startswith(HISTOGRAM_PREFIX)
+
+def histogram_columns(df: pd.DataFrame) -> List[str]:
+    """
+    Returns the bucket columns of `df`, in bucket order.
+    """
+    return [col for col in df.columns if isinstance(col, str) and col.startswith(BUCKET_PREFIX)]
+
+def bounds_from_columns(columns: Sequence[str]) -> np.ndarray:
+    """
+    Recovers the finite bucket boundaries from bucket column names.
+    """
+    return np.array([float(col[len(BUCKET_PREFIX):]) for col in columns[:-1]], dtype=np.float64)
+
+def percentiles(counts: np.ndarray, bounds: np.ndarray, qs: Sequence[float]) -> np.ndarray:
+    """
+    Estimates percentiles from a 2-D array of bucket counts (one histogram per row),
+    interpolating linearly within the bucket that holds each rank. Returns an array of
+    shape (rows, len(qs)); rows without samples are NaN.
+
+    The underflow bucket is taken to start at zero (or at the first boundary if that is
+    negative), and ranks that fall in the overflow bucket report the last boundary.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    bounds = np.asarray(bounds, dtype=np.float64)
+    qs = np.asarray(qs, dtype=np.float64) / 100.0
+    if bounds.size == 0:
+        return np.full((counts.shape[0], qs.size), np.nan)
+
+    cumulative = np.cumsum(counts, axis=1)
+    totals = cumulative[:, -1]
+    ranks = totals[:, None] * qs[None, :]
+
+    # Index of the bucket holding each rank: the number of buckets that end below it.
+    index = (cumulative[:, None, :] < ranks[:, :, None]).sum(axis=2)
+    index = np.minimum(index, counts.shape[1] - 1)
+
+    lower_edges = np.concatenate([[min(0.0, bounds[0])], bounds])
+    upper_edges = np.concatenate([bounds, [bounds[-1]]])
+    before = np.take_along_axis(cumulative - counts, index, axis=1)
+    in_bucket = np.take_along_axis(counts, index, axis=1)
+    fraction = np.divide(ranks - before, in_bucket, out=np.zeros_like(ranks), where=in_bucket > 0)
+
+    values = lower_edges[index] + np.clip(fraction, 0.0, 1.0) * (upper_edges[index] - lower_edges[index])
+    values[totals == 0] = np.nan
+    return values
+
+def merge_histograms(df: pd.DataFrame, by: List[str], value_column: str) -> pd.DataFrame:
+    """
+    Merges histograms across every dimension not in `by`, by summing sample counts,
+    sample sums and bucket counts within each group.
+    """
+    summed = [value_column, SUM_COLUMN] + histogram_columns(df)
+    return df.groupby(by, observed=True, sort=True)[summed].sum().reset_index()
+
+def summarize(df: pd.DataFrame, value_column: str, qs: Sequence[float]) -> pd.DataFrame:
+    """
+    Replaces the histogram columns of `df` with a `mean` column and one `p<q>` column
+    per requested percentile.
+    """
+    columns = histogram_columns(df)
+    if not columns:
+        return df
+    values = percentiles(df[columns].to_numpy(), bounds_from_columns(columns), qs)
+
+    summary = df[[col for col in df.columns if not is_histogram_column(col)]].copy()
+    counts = df[value_column].to_numpy(dtype=np.float64)
+    summary["mean"] = np.divide(
+        df[SUM_COLUMN].to_numpy(dtype=np.float64), counts,
+        out=np.full(len(df), np.nan), where=counts > 0,
+    )
+    for position, q in enumerate(qs):
+        summary[f"p{q:g}"] = values[:, position]
+    return summary
@@ -0,0 +1,181 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+# Run instrumentation: time spent per phase and counters (pages fetched, points
+# decoded, bytes written, ...), optionally broken down by metric. Recording is off
+# by default; until enable() is called span() hands out one shared no-op context
+# manager and count() returns immediately, so the calls cost next to nothing.
+
+PROMETHEUS_PREFIX = "pt_monitor"
+
+_NULL_SPAN = contextlib.nullcontext()
+
+class Recorder:
+    """
+    Accumulates span durations and counters. Safe to use from several threads;
+    spans that run concurrently each add their own duration.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        # (phase, metric) -> [calls, seconds]
+        self.spans: Dict[Tuple[str, str], list] = {}
+        # (counter, metric) -> value
+        self.counters: Dict[Tuple[str, str], float] = {}
+
+    @contextlib.contextmanager
+    def span(self, phase: str, metric: str = ""):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                totals = self.spans.setdefault((phase, metric), [0, 0.0])
+                totals[0] += 1
+                totals[1] += elapsed
+
+    def count(self, counter: str, value: float, metric: str = ""):
+        with self._lock:
+            self.counters[(counter, metric)] = self.counters.get((counter, metric), 0) + value
+
+    def snapshot(self) -> dict:
+        """
+        Returns the recorded values as a JSON-serialisable dict.
+        """
+        with self._lock:
+            return {
+                "wall_seconds": time.perf_counter() - self.started,
+                "spans": [
+                    {"phase": phase, "metric": metric, "calls": calls, "seconds": seconds}
+                    for (phase, metric), (calls, seconds) in sorted(self.spans.items())
+                ],
+                "counters": [
+                    {"counter": counter, "metric": metric, "value": value}
+                    for (counter, metric), value in sorted(self.counters.items())
+                ],
+            }
+
+    def merge(self, snapshot: dict):
+        """
+        Adds the spans and counters of a snapshot taken in another process.
+        """
+        with self._lock:
+            for span in snapshot["spans"]:
+                totals = self.spans.setdefault((span["phase"], span["metric"]), [0, 0.0])
+                totals[0] += span["calls"]
+                totals[1] += span["seconds"]
+            for counter in snapshot["counters"]:
+                key = (counter["counter"], counter["metric"])
+                self.counters[key] = self.counters.get(key, 0) + counter["value"]
+
+_recorder: Optional[Recorder] = None
+
+def enable() -> Recorder:
+    """
+    Starts recording for the rest of the process and returns the recorder.
+    """
+    global _recorder
+    if _recorder is None:
+        _recorder = Recorder()
+    return _recorder
+
+def is_enabled() -> bool:
+    return _recorder is not None
+
+def span(phase: str, metric: str = ""):
+    """
+    Returns a context manager that adds its duration to `phase` (and `metric`).
+    """
+    if _recorder is None:
+        return _NULL_SPAN
+    return _recorder.span(phase, metric)
+
+def count(counter: str, value: float = 1, metric: str = ""):
+    if _recorder is not None:
+        _recorder.count(counter, value, metric)
+
+def run_recorded(fn: Callable, *args, **kwargs):
+    """
+    Runs `fn` with recording enabled and returns its result together with a snapshot
+    of what it recorded. Used to bring back the measurements of work done in a
+    worker process, where the parent's recorder does not exist.
+    """
+    recorder = enable()
+    result = fn(*args, **kwargs)
+    snapshot = recorder.snapshot()
+    recorder.spans.clear()
+    recorder.counters.clear()
+    return result, snapshot
+
+def merge(snapshot: dict):
+    if _recorder is not None:
+        _recorder.merge(snapshot)
+
+def prometheus_labels(**labels) -> str:
+    """
+    Formats label pairs as a Prometheus label set, escaping the values; empty values are left out.
+    """
+    escaped = {
+        name: str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        for name, value in labels.items()
+        if value
+    }
+    if not escaped:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped.items()) + "}"
+
+def to_prometheus(snapshot: dict) -> str:
+    """
+    Renders a snapshot in the Prometheus text exposition format.
+    """
+    lines = [
+        f"# HELP {PROMETHEUS_PREFIX}_run_seconds Wall-clock duration of the run.",
+        f"# TYPE {PROMETHEUS_PREFIX}_run_seconds gauge",
+        f"{PROMETHEUS_PREFIX}_run_seconds {snapshot['wall_seconds']:.6f}",
+        f"# HELP {PROMETHEUS_PREFIX}_phase_seconds_total Time spent in each phase, summed over threads.",
+        f"# TYPE {PROMETHEUS_PREFIX}_phase_seconds_total counter",
+    ]
+    for span in snapshot["spans"]:
+        labels = prometheus_labels(phase=span["phase"], metric=span["metric"])
+        lines.append(f"{PROMETHEUS_PREFIX}_phase_seconds_total{labels} {span['seconds']:.6f}")
+    lines += [
+        f"# HELP {PROMETHEUS_PREFIX}_phase_calls_total Number of times each phase ran.",
+        f"# TYPE {PROMETHEUS_PREFIX}_phase_calls_total counter",
+    ]
+    for span in snapshot["spans"]:
+        labels = prometheus_labels(phase=span["phase"], metric=span["metric"])
+        lines.append(f"{PROMETHEUS_PREFIX}_phase_calls_total{labels} {span['calls']}")
+
+    counter_names = sorted({counter["counter"] for counter in snapshot["counters"]})
+    for name in counter_names:
+        lines += [f"# TYPE {PROMETHEUS_PREFIX}_{name}_total counter"]
+        for counter in snapshot["counters"]:
+            if counter["counter"] == name:
+                labels = prometheus_labels(metric=counter["metric"])
+                lines.append(f"{PROMETHEUS_PREFIX}_{name}_total{labels} {counter['value']}")
+    return "\n".join(lines) + "\n"
+
+def write(path: str):
+    """
+    Writes the recorded values to `path`: Prometheus text format if it ends in
+    `.prom`, JSON otherwise. The file is replaced atomically, so a textfile
+    collector never reads a partial file.
+    """
+    if _recorder is None:
+        return
+    snapshot = _recorder.snapshot()
+    if path.endswith(".prom"):
+        content = to_prometheus(snapshot)
+    else:
+        content = json.dumps(snapshot, indent=2) + "\n"
+
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as f:
+        f.write(content)
+    os.replace(temporary, path)
@@ -1,22 +1,248 @@
 import argparse
+import atexit
+import contextlib
+import importlib.util
 import logging
-import pandas as pd
+import os
+import signal
+import sys
 
-from .gcp_client import query_metric, log_authentication_method
-from .charting import generate_chart
+# Only lightweight modules are imported here, so --help and argument errors return
+# immediately. pandas, the Cloud Monitoring client and matplotlib are imported on
+# the code paths that use them.
 from .config.metrics import METRIC_CONFIGS
+from .config.query import CACHE_ENV_VAR, ONE_DAY_S, RESOLUTIONS, RESOURCE_LABELS
+from . import instrumentation
 
-# --- Setup Logging ---
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
+OUTPUT_FORMATS = ["markdown", "csv", "json", "jsonl", "ndjson", "parquet", "arrow"]
+# Formats written through pyarrow rather than as text.
+BINARY_FORMATS = ("parquet", "arrow")
+STREAM_FORMATS = ("csv", "jsonl", "ndjson")
+# Other names accepted by --output for the same format.
+FORMAT_ALIASES = {"ndjson": "jsonl"}
+# Arguments that decide what a run fetches and renders; --resume only continues a
+# checkpoint written with the same ones (and the same projects).
+CHECKPOINT_ARGS = (
+    "metric", "all_metrics", "wide", "generate_report_charts", "days_ago_start", "days_ago_end",
+    "resolution", "percentiles", "filters", "group_by", "filter_model_id", "top_n", "no_coalesce",
 )
 
-def generate_report_charts(project_id, days_ago_start, days_ago_end, filter_model_id, metrics_with_data, metrics_without_data):
+# --- Setup Logging ---
+def setup_logging():
+    """
+    Configures the root logger. Also run in the chart worker processes, which are
+    spawned without this module's logging setup.
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+
+setup_logging()
+
+def output_path(output_file, metric_name):
+    """
+    Returns the --output-file path for a metric ('{metric}' is replaced by its name),
+    or None to write to stdout.
+    """
+    return output_file.replace("{metric}", metric_name) if output_file else None
+
+def print_data(data, output_format, metric_name="", path=None):
+    """
+    Writes a complete DataFrame to stdout, or to the file at `path`, in the given
+    output format. Parquet and Arrow keep the column types (see monitor.formats).
+    """
+    if data.empty:
+        return
+    with instrumentation.span("format", metric_name):
+        if output_format in BINARY_FORMATS:
+            from .formats import write_arrow, write_parquet
+            written = write_parquet(data, path) if output_format == "parquet" else write_arrow(data, path)
+        else:
+            with open(path, "w") if path else contextlib.nullcontext(sys.stdout) as out:
+                if output_format == "jsonl":
+                    from .formats import write_ndjson
+                    written = write_ndjson(data, out)
+                else:
+                    if output_format == "markdown":
+                        text = data.to_markdown(index=False)
+                    elif output_format == "csv":
+                        text = data.to_csv(index=False)
+                    elif output_format == "json":
+                        text = data.to_json(orient="records", indent=2)
+                    written = out.write(text + "\n")
+    if instrumentation.is_enabled():
+        instrumentation.count("bytes_written", written, metric_name)
+        instrumentation.count("rows_written", len(data), metric_name)
+
+def stream_data(pages, columns, output_format, out=None, metric_name=""):
+    """
+    Writes decoded pages to `out` (stdout by default) as they arrive, in CSV or JSON Lines.
+    The CSV header comes from the fixed column schema, so it can be written before the
+    first page. Returns the number of rows written.
+    """
+    out = out or sys.stdout
+    written = 0
+    if output_format == "csv":
+        written += out.write(",".join(columns) + "\n")
+
+    rows = 0
+    for page in pages:
+        with instrumentation.span("format", metric_name):
+            if output_format == "csv":
+                written += out.write(page.to_csv(header=False, index=False))
+            else:
+                from .formats import write_ndjson
+                written += write_ndjson(page, out)
+            out.flush()
+        rows += len(page)
+    instrumentation.count("bytes_written", written, metric_name)
+    instrumentation.count("rows_written", rows, metric_name)
+    return rows
+
+def period_label(resolution):
+    """
+    Returns the chart title prefix for a --resolution value.
+    """
+    return "Daily" if resolution in (None, "1d") else f"{resolution}-resolution"
+
+def parse_percentiles(value):
+    """
+    Parses a comma-separated list of percentiles such as '50,95,99'.
+    """
+    try:
+        percentiles = [float(item) for item in value.split(',') if item.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid percentile list: '{value}'.")
+    if not percentiles or any(not 0 <= q <= 100 for q in percentiles):
+        raise argparse.ArgumentTypeError("Percentiles must be between 0 and 100.")
+    return percentiles
+
+def parse_interval(value):
+    """
+    Parses a polling interval in seconds, optionally with an s, m, h or d suffix (e.g. '5m').
+    """
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    number, unit = (value[:-1], value[-1]) if value and value[-1] in units else (value, "s")
+    try:
+        seconds = int(float(number) * units[unit])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid interval: '{value}'.")
+    if seconds < 1:
+        raise argparse.ArgumentTypeError("The interval must be at least one second.")
+    return seconds
+
+def load_project_ids(project_id_arg, projects_file):
+    """
+    Returns the project IDs from a comma-separated --project-id value or from a file
+    with one project ID per line (blank lines and '#' comments are ignored).
+    """
+    if projects_file:
+        with open(projects_file) as f:
+            entries = [line.split('#', 1)[0] for line in f]
+    else:
+        entries = project_id_arg.split(',')
+    return list(dict.fromkeys(entry.strip() for entry in entries if entry.strip()))
+
+def parse_metric_list(value):
+    """
+    Parses a comma-separated list of at least two metric names for --wide.
+    """
+    names = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in names if name not in METRIC_CONFIGS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Unknown metric(s): {', '.join(unknown)}.")
+    if len(names) < 2:
+        raise argparse.ArgumentTypeError("--wide needs at least two metrics.")
+    return names
+
+def parse_filter(value):
+    """
+    Parses a 'label=value' filter argument into a (label, value) pair.
+    """
+    label, separator, label_value = value.partition('=')
+    if not separator or not label.strip():
+        raise argparse.ArgumentTypeError(f"Invalid filter '{value}'. Expected 'label=value'.")
+    return label.strip(), label_value
+
+def print_local_rollups(store, project_ids, metric_names, days_ago_start, days_ago_end, grain, output_format, group_by, filters, metrics_with_data, metrics_without_data, generate_graph=False, graph_group_by=None, output_file=None, top_n=None):
+    """
+    Answers a query from the local rollup store instead of the API. Rows are grouped by
+    `group_by`, or by `graph_group_by` when only that is given, otherwise by every label.
+    """
+    from .rollups import window_days
+
+    first_day, last_day = window_days(days_ago_start, days_ago_end)
+    labels = group_by if group_by is not None else graph_group_by
+    for metric_name in metric_names:
+        metric_config = METRIC_CONFIGS[metric_name]
+        with instrumentation.span("rollup_query", metric_name):
+            usage_data = store.query(metric_config, project_ids, first_day, last_day, grain, labels, filters)
+        if usage_data.empty:
+            metrics_without_data.append(metric_name)
+            continue
+        metrics_with_data.append(metric_name)
+        if len(metric_names) > 1 and not output_file:
+            print(f"\n--- Metric: {metric_name} ---")
+        print_data(usage_data, output_format, metric_name, output_path(output_file, metric_name))
+        if generate_graph:
+            from .charting import render_metric_chart
+            render_metric_chart(usage_data, metric_config, graph_group_by or [], {"day": "Daily", "week": "Weekly", "month": "Monthly"}[grain], top_n=top_n)
+
+def refresh_rollups(store, results, project_ids, days_ago_start, days_ago_end, metrics_failed):
+    """
+    Rebuilds the rollups of the queried window from freshly fetched daily rows,
+    skipping metrics whose query failed.
+    """
+    from .rollups import window_days
+
+    first_day, last_day = window_days(days_ago_start, days_ago_end)
+    for metric_name, usage_data in results.items():
+        if metric_name in metrics_failed:
+            continue
+        with instrumentation.span("rollup_refresh", metric_name):
+            store.refresh(METRIC_CONFIGS[metric_name], usage_data, project_ids, first_day, last_day)
+
+def log_summary(metrics_with_data, metrics_without_data, metrics_failed):
+    """
+    Logs which metrics had data, had none or failed, when more than one was queried.
+    """
+    if len(metrics_with_data) + len(metrics_without_data) + len(metrics_failed) <= 1:
+        return
+    logging.info("\n\n--- Query Summary ---")
+    if metrics_with_data:
+        logging.info("Metrics with data found:")
+        for metric in sorted(metrics_with_data):
+            logging.info(f"  - {metric}")
+    if metrics_without_data:
+        logging.info("Metrics with no data:")
+        for metric in sorted(metrics_without_data):
+            logging.info(f"  - {metric}")
+    if metrics_failed:
+        logging.info("Metrics that failed (results are missing or incomplete):")
+        for metric in sorted(metrics_failed):
+            logging.info(f"  - {metric}: {metrics_failed[metric]}")
+    logging.info("--- End of Summary ---")
+
+def generate_report_charts(project_ids, days_ago_start, days_ago_end, filter_model_id, metrics_with_data, metrics_without_data, max_concurrency=1, cache=None, resolution=None, percentiles=None, filters=None, client=None, coalesce=True, errors=None, top_n=None, checkpoint=None):
     """
     Generates a standard set of charts for key metrics.
+    Metrics are fetched concurrently if max_concurrency > 1, already filtered and
+    grouped by only the labels their chart uses. Each chart is rendered in a worker
+    process (in this process when there is only one CPU) as soon as its metric
+    arrives, while the other metrics are still fetched.
+    Metrics whose query failed are recorded in `errors` (see iter_query_metrics), as are
+    metrics whose chart could not be rendered.
+    With a `checkpoint`, each rendered chart is recorded in it, and metrics whose
+    chart an earlier run already rendered are neither fetched nor charted again.
     """
+    import concurrent.futures
+    import multiprocessing
+
+    from .charting import render_metric_chart
+    from .gcp_client import iter_query_metrics
+
     logging.info("--- Starting Standard Chart Generation ---")
     
     report_metrics = {
@@ -28,45 +254,108 @@ def generate_report_charts(project_id, days_ago_start, days_ago_end, filter_mode
         "model_invocation_latencies": ["latency_type"],
     }
 
-    for metric_name, group_by_cols in report_metrics.items():
-        logging.info(f"--- Processing metric: {metric_name} ---")
+    finished_charts = checkpoint.finished_charts() if checkpoint is not None else {}
+    metric_configs = []
+    for metric_name in report_metrics:
         metric_config = METRIC_CONFIGS.get(metric_name)
         if not metric_config:
             logging.warning(f"Metric '{metric_name}' not found in configurations. Skipping.")
             continue
+        if metric_name in finished_charts:
+            logging.info(f"Chart for {metric_name} already rendered as {finished_charts[metric_name]}. Skipping.")
+            metrics_with_data.append(metric_name)
+            continue
+        metric_configs.append(metric_config)
+    if not metric_configs:
+        logging.info("--- Standard Chart Generation Complete ---")
+        return
 
-        usage_data = query_metric(
-            project_id=project_id,
-            metric_config=metric_config,
-            days_ago_start=days_ago_start,
-            days_ago_end=days_ago_end,
-        )
+    filters = dict(filters or {})
+    if filter_model_id:
+        filters['model_user_id'] = filter_model_id
 
-        if usage_data.empty:
-            metrics_without_data.append(metric_name)
-            logging.warning(f"No data returned for {metric_name}. Skipping chart generation.")
-            continue
+    results = iter_query_metrics(
+        project_id=project_ids,
+        metric_configs=metric_configs,
+        days_ago_start=days_ago_start,
+        days_ago_end=days_ago_end,
+        max_concurrency=max_concurrency,
+        cache=cache,
+        alignment_period_s=RESOLUTIONS[resolution or "1d"],
+        histogram=bool(percentiles),
+        group_by=report_metrics,
+        filters=filters,
+        client=client,
+        coalesce=coalesce,
+        errors=errors,
+        checkpoint=checkpoint,
+    )
+
+    def collect(metric_name, render):
+        """
+        Runs `render`, which returns the saved chart's filename, and records the outcome.
+        """
+        try:
+            filename = render()
+            if checkpoint is not None and filename:
+                checkpoint.mark_chart(metric_name, os.path.abspath(filename))
+        except Exception as e:
+            logging.error(f"Could not generate the chart for {metric_name}: {e}")
+            # The metric had data, but without its chart the report is incomplete.
+            metrics_with_data.remove(metric_name)
+            if errors is not None:
+                errors[metric_name] = e
+
+    def from_worker(future):
+        result = future.result()
+        if instrumentation.is_enabled():
+            result, recorded = result
+            instrumentation.merge(recorded)
+        return result
 
-        if filter_model_id and 'model_user_id' in usage_data.columns:
-            original_rows = len(usage_data)
-            usage_data = usage_data[usage_data['model_user_id'] == filter_model_id]
-            logging.info(f"Filtered by model_user_id '{filter_model_id}'. Kept {len(usage_data)} of {original_rows} rows.")
+    # Workers are spawned rather than forked, so they do not inherit the gRPC channel
+    # or the fetch threads of this process. With a single worker there is nothing to
+    # run in parallel, and spawning one (which imports pandas and matplotlib again)
+    # only adds time, so charts are then rendered here while the fetch threads run.
+    workers = min(len(metric_configs), os.cpu_count() or 1) or 1
+    pool = concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=setup_logging,
+    ) if workers > 1 else contextlib.nullcontext()
+    with pool as executor:
+        renders = {}
+        for metric_name, usage_data in results:
+            logging.info(f"--- Processing metric: {metric_name} ---")
             if usage_data.empty:
-                metrics_without_data.append(metric_name)
-                logging.warning(f"No data remains for {metric_name} after filtering. Skipping chart generation.")
+                if errors is None or metric_name not in errors:
+                    metrics_without_data.append(metric_name)
+                    logging.warning(f"No data returned for {metric_name}. Skipping chart generation.")
                 continue
-        
-        metrics_with_data.append(metric_name)
-        generate_chart(usage_data, metric_config.name, metric_config.value_name, group_by_cols)
+
+            metrics_with_data.append(metric_name)
+            chart_args = (usage_data, METRIC_CONFIGS[metric_name], report_metrics[metric_name], period_label(resolution), percentiles, top_n)
+            if executor is None:
+                collect(metric_name, lambda: render_metric_chart(*chart_args))
+            elif instrumentation.is_enabled():
+                # Workers record their own measurements and send them back with the result.
+                renders[metric_name] = executor.submit(instrumentation.run_recorded, render_metric_chart, *chart_args)
+            else:
+                renders[metric_name] = executor.submit(render_metric_chart, *chart_args)
+
+        for metric_name, future in renders.items():
+            collect(metric_name, lambda: from_worker(future))
 
     logging.info("--- Standard Chart Generation Complete ---")
 
 def main():
-    log_authentication_method()
-
     parser = argparse.ArgumentParser(description="Google Cloud AI Platform Token Usage Monitor.")
-    parser.add_argument(
-        "--project-id", type=str, required=True, help="Your Google Cloud Project ID."
+    project_group = parser.add_mutually_exclusive_group(required=True)
+    project_group.add_argument(
+        "--project-id", type=str,
+        help="Your Google Cloud Project ID, or a comma-separated list of project IDs."
+    )
+    project_group.add_argument(
+        "--projects-file", type=str,
+        help="File with one Google Cloud Project ID per line."
     )
     
     mode_group = parser.add_mutually_exclusive_group(required=True)
@@ -76,7 +365,12 @@ def main():
     )
     mode_group.add_argument(
         "--all-metrics", action="store_true", 
-        help="Query all available metrics sequentially for data output."
+        help="Query all available metrics for data output."
+    )
+    mode_group.add_argument(
+        "--wide", type=parse_metric_list, metavar="METRIC,METRIC[,...]",
+        help="Query several metrics into one table on a shared (date, project_id, location, model_user_id) "
+             "index, with utilisation ratios for usage/limit pairs (e.g. consumed_token_throughput,dedicated_token_limit)."
     )
     mode_group.add_argument(
         "--generate-report-charts", action="store_true",
@@ -93,8 +387,31 @@ def main():
     )
     
     parser.add_argument(
-        "--output", type=str, default="markdown", choices=["markdown", "csv", "json"],
-        help="The output format for the results (used with --metric or --all-metrics)."
+        "--resolution", type=str, choices=list(RESOLUTIONS.keys()),
+        help="Alignment period of the returned points (default: 1d). Long windows at "
+             "sub-daily resolution are split into chunks and fetched in parallel."
+    )
+    
+    parser.add_argument(
+        "--output", type=str, default="markdown", choices=OUTPUT_FORMATS,
+        help="The output format for the results (used with --metric or --all-metrics). jsonl (alias "
+             "ndjson) writes ISO 8601 dates. parquet and arrow (an Arrow IPC stream) keep the column "
+             "types and need pyarrow."
+    )
+    parser.add_argument(
+        "--output-file", type=str,
+        help="Write the results to this file instead of stdout. With --all-metrics it must contain "
+             "'{metric}', which is replaced by each metric's name."
+    )
+    parser.add_argument(
+        "--stream", action="store_true",
+        help="Write rows as each API page is decoded instead of after the full query "
+             "(requires --output csv, jsonl or ndjson; rows are not sorted)."
+    )
+    parser.add_argument(
+        "--percentiles", type=parse_percentiles,
+        help="Comma-separated percentiles (e.g., '50,95,99') to report for distribution metrics "
+             "instead of only their sample count. Also used for their charts."
     )
     parser.add_argument(
         "--generate-graph", action="store_true",
@@ -104,91 +421,456 @@ def main():
         "--graph-group-by", type=str,
         help="Comma-separated columns to group by for the graph (e.g., 'request_type,model_user_id')."
     )
+    parser.add_argument(
+        "--top-n", type=int,
+        help="Chart only the N largest series of a grouped chart and fold the rest into one 'other' "
+             "line (used with --generate-graph and --generate-report-charts)."
+    )
     parser.add_argument(
         "--filter-model-id", type=str,
         help="Filter data by a specific model_user_id (used with --generate-report-charts)."
     )
+    parser.add_argument(
+        "--filter", type=parse_filter, action="append", default=[], dest="filters", metavar="LABEL=VALUE",
+        help="Only return series whose label equals the value (repeatable; applied by Cloud Monitoring). "
+             "Ignored for metrics that do not have the label."
+    )
+    parser.add_argument(
+        "--group-by", type=str,
+        help="Comma-separated labels to keep in the results (e.g., 'model_user_id'). Cloud Monitoring "
+             "aggregates over all other labels with the metric's reducer. project_id is always kept."
+    )
+    parser.add_argument(
+        "--max-concurrency", type=int, default=1,
+        help="Maximum number of metric queries, or time chunks of one metric, to fetch at once."
+    )
+    parser.add_argument(
+        "--quota-rpm", type=int,
+        help="Read requests per minute to allow per project (default: unlimited). Requests are "
+             "spaced evenly to stay under the project's Cloud Monitoring read quota."
+    )
+    parser.add_argument(
+        "--max-attempts", type=int, default=6,
+        help="Attempts per request on quota, timeout and unavailable errors before the metric "
+             "is reported as failed (default: 6)."
+    )
+    parser.add_argument(
+        "--page-size", type=int,
+        help="Maximum points per API page (default: the API's maximum of 100,000). Pages hold whole "
+             "time series, so smaller pages carry fewer series each."
+    )
+    parser.add_argument(
+        "--prefetch-pages", type=int, default=1,
+        help="Pages to fetch ahead of the one being decoded, to overlap network wait and decoding "
+             "(0 to fetch each page only when it is needed; default: 1)."
+    )
+    parser.add_argument(
+        "--no-coalesce", action="store_true",
+        help="Send one request per metric instead of one per group of compatible metrics."
+    )
+    parser.add_argument(
+        "--cache-dir", type=str, default=os.environ.get(CACHE_ENV_VAR),
+        help=f"Directory for the local cache of closed days (defaults to ${CACHE_ENV_VAR}). "
+             "When set, days are aligned to UTC and only uncached days are fetched."
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="Ignore the cache and query the full window from the API."
+    )
+    parser.add_argument(
+        "--clear-cache", action="store_true",
+        help="Delete the cached days of the given projects before querying."
+    )
+    parser.add_argument(
+        "--local", action="store_true",
+        help="Answer from the local rollups in the cache directory, without any API call. Rollups are "
+             "refreshed by daily --metric or --all-metrics runs that use the cache and no --group-by or --filter."
+    )
+    parser.add_argument(
+        "--rollup", type=str, default="day", choices=["day", "week", "month"],
+        help="Period of the rows returned by --local (default: day)."
+    )
+    parser.add_argument(
+        "--checkpoint-dir", type=str,
+        help="Record the run's progress in this directory after each metric, time chunk and chart: "
+             "a manifest of the finished work and the fetched results. Starts over unless --resume is given."
+    )
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="Continue the run checkpointed in --checkpoint-dir, fetching and rendering only what it "
+             "had not finished. The query arguments must match the checkpointed run."
+    )
+    parser.add_argument(
+        "--watch", type=parse_interval, metavar="INTERVAL",
+        help="Run until interrupted, polling every INTERVAL (e.g. '60', '5m') only for the data since "
+             "the previous poll, and serve the latest aggregates over HTTP (used with --metric or --all-metrics)."
+    )
+    parser.add_argument(
+        "--watch-host", type=str, default="127.0.0.1",
+        help="Address the --watch endpoint listens on (default: 127.0.0.1)."
+    )
+    parser.add_argument(
+        "--watch-port", type=int, default=9464,
+        help="Port of the --watch endpoint (default: 9464)."
+    )
+    parser.add_argument(
+        "--metrics-out", type=str,
+        help="Write per-phase timings and counters of this run to a file: Prometheus text "
+             "format if the name ends in .prom, JSON otherwise."
+    )
 
     args = parser.parse_args()
+    args.output = FORMAT_ALIASES.get(args.output, args.output)
+    if args.metrics_out:
+        instrumentation.enable()
+        # Written on every exit path, including errors and early returns.
+        atexit.register(instrumentation.write, args.metrics_out)
 
     if args.generate_graph and not args.metric:
         parser.error("--generate-graph can only be used with the --metric flag.")
     if args.graph_group_by and not args.generate_graph:
         parser.error("--graph-group-by can only be used with --generate-graph.")
+    if args.top_n is not None:
+        if not (args.generate_graph or args.generate_report_charts):
+            parser.error("--top-n can only be used with --generate-graph or --generate-report-charts.")
+        if args.top_n < 1:
+            parser.error("--top-n must be at least 1.")
     if args.filter_model_id and not args.generate_report_charts:
         parser.error("--filter-model-id can only be used with --generate-report-charts.")
+    known_labels = set(RESOURCE_LABELS).union(*(config.metric_labels for config in METRIC_CONFIGS.values()))
+    for label, _ in args.filters:
+        if label not in known_labels:
+            parser.error(f"Unknown filter label '{label}'. Known labels: {', '.join(sorted(known_labels))}.")
+    group_by = [label.strip() for label in args.group_by.split(',') if label.strip()] if args.group_by else None
+    for label in group_by or []:
+        if label not in known_labels:
+            parser.error(f"Unknown --group-by label '{label}'. Known labels: {', '.join(sorted(known_labels))}.")
+    if group_by is not None and args.generate_report_charts:
+        parser.error("--group-by cannot be used with --generate-report-charts, which groups each chart itself.")
+    if args.wide and (group_by is not None or args.percentiles):
+        parser.error("--wide has a fixed index and reports totals; --group-by and --percentiles are not supported.")
+    filters = dict(args.filters)
+    if args.max_concurrency < 1:
+        parser.error("--max-concurrency must be at least 1.")
+    if args.quota_rpm is not None and args.quota_rpm < 1:
+        parser.error("--quota-rpm must be at least 1.")
+    if args.max_attempts < 1:
+        parser.error("--max-attempts must be at least 1.")
+    if args.page_size is not None and args.page_size < 1:
+        parser.error("--page-size must be at least 1.")
+    if args.prefetch_pages < 0:
+        parser.error("--prefetch-pages cannot be negative.")
+    if args.stream and args.output not in STREAM_FORMATS:
+        parser.error("--stream requires --output csv, jsonl or ndjson.")
+    if args.output in BINARY_FORMATS and importlib.util.find_spec("pyarrow") is None:
+        parser.error(f"--output {args.output} requires pyarrow (uv sync --extra arrow).")
+    if args.output_file:
+        if args.generate_report_charts or args.watch:
+            parser.error("--output-file can only be used with --metric or --all-metrics.")
+        if args.all_metrics and "{metric}" not in args.output_file:
+            parser.error("--output-file must contain '{metric}' with --all-metrics.")
+    elif args.output == "parquet" and not (args.generate_report_charts or args.watch):
+        parser.error("--output parquet requires --output-file.")
+    elif args.output == "arrow" and args.all_metrics:
+        parser.error("An Arrow stream holds one table; use --output-file with '{metric}' for --all-metrics.")
+    if args.stream and (args.generate_report_charts or args.generate_graph):
+        parser.error("--stream cannot be combined with chart generation.")
+    if args.stream and args.wide:
+        parser.error("--stream cannot be combined with --wide, which aligns complete results.")
+    if args.stream and args.percentiles:
+        parser.error("--stream cannot be combined with --percentiles.")
+    if args.watch:
+        if args.generate_report_charts or args.generate_graph:
+            parser.error("--watch cannot be combined with chart generation.")
+        if args.wide:
+            parser.error("--watch can only be used with --metric or --all-metrics.")
+        if args.stream or args.percentiles:
+            parser.error("--watch cannot be combined with --stream or --percentiles.")
+        if args.days_ago_end != 0:
+            parser.error("--watch keeps a window that ends now; --days-ago-end must be 0.")
+    if args.local:
+        if not args.cache_dir:
+            parser.error(f"--local requires --cache-dir or ${CACHE_ENV_VAR}.")
+        if args.generate_report_charts or args.wide or args.stream or args.watch:
+            parser.error("--local can only be used with --metric or --all-metrics.")
+        if args.percentiles or args.resolution not in (None, "1d"):
+            parser.error("--local rollups hold daily totals; --percentiles and --resolution are not supported.")
+    elif args.rollup != "day":
+        parser.error("--rollup can only be used with --local.")
+    if args.clear_cache and not args.cache_dir:
+        parser.error(f"--clear-cache requires --cache-dir or ${CACHE_ENV_VAR}.")
+    if args.resume and not args.checkpoint_dir:
+        parser.error("--resume requires --checkpoint-dir.")
+    if args.checkpoint_dir and (args.stream or args.watch or args.local):
+        parser.error("--checkpoint-dir cannot be combined with --stream, --watch or --local.")
+
+    try:
+        project_ids = load_project_ids(args.project_id, args.projects_file)
+    except OSError as e:
+        parser.error(f"Could not read --projects-file: {e}")
+    if not project_ids:
+        parser.error("No project IDs were given.")
+    if len(project_ids) > 1:
+        logging.info(f"Querying {len(project_ids)} projects: {', '.join(project_ids)}")
+
+    if args.local:
+        # Answered entirely from disk, so no credentials or client are needed.
+        from .rollups import RollupStore
+
+        metrics_with_data = []
+        metrics_without_data = []
+        print_local_rollups(
+            RollupStore(args.cache_dir),
+            project_ids,
+            list(METRIC_CONFIGS.keys()) if args.all_metrics else [args.metric],
+            args.days_ago_start,
+            args.days_ago_end,
+            args.rollup,
+            args.output,
+            group_by,
+            filters,
+            metrics_with_data,
+            metrics_without_data,
+            generate_graph=args.generate_graph,
+            graph_group_by=args.graph_group_by.split(',') if args.graph_group_by else None,
+            output_file=args.output_file,
+            top_n=args.top_n,
+        )
+        log_summary(metrics_with_data, metrics_without_data, {})
+        return
+
+    checkpoint = None
+    if args.checkpoint_dir:
+        from .checkpoint import Checkpoint, CheckpointMismatch
+
+        params = {name: getattr(args, name) for name in CHECKPOINT_ARGS}
+        params["project_ids"] = project_ids
+        try:
+            checkpoint = Checkpoint(args.checkpoint_dir, params, resume=args.resume)
+        except CheckpointMismatch as e:
+            parser.error(str(e))
+
+    with instrumentation.span("import"):
+        from .gcp_client import (
+            MetricQueryError, RequestScheduler, get_client, iter_metric_pages, log_authentication_method,
+            query_metrics, query_wide, stream_columns,
+        )
+        from .histograms import summarize
+
+    with instrumentation.span("auth"):
+        credentials = log_authentication_method()
+
+    alignment_period_s = RESOLUTIONS[args.resolution or "1d"]
 
-    def print_data(data, output_format):
-        if data.empty:
-            return
-        if output_format == "markdown":
-            print(data.to_markdown(index=False))
-        elif output_format == "csv":
-            print(data.to_csv(index=False))
-        elif output_format == "json":
-            print(data.to_json(orient="records", indent=2))
+    cache = None
+    rollups = None
+    if args.cache_dir:
+        from .cache import MetricCache
+        from .rollups import RollupStore
+        metric_cache = MetricCache(args.cache_dir)
+        rollup_store = RollupStore(args.cache_dir)
+        if args.clear_cache:
+            for project_id in project_ids:
+                metric_cache.invalidate(project_id=project_id)
+                rollup_store.invalidate(project_id)
+        if not args.no_cache:
+            cache = metric_cache
+            # Only full-detail daily rows on the cache's UTC day grid can feed the rollups.
+            if alignment_period_s == ONE_DAY_S and group_by is None and not filters:
+                rollups = rollup_store
+
+    # One client (and gRPC channel) built from the already loaded credentials serves
+    # every metric and project in the run, and one scheduler paces and retries all
+    # of its requests.
+    scheduler = RequestScheduler(
+        max_concurrency=args.max_concurrency,
+        requests_per_minute=args.quota_rpm,
+        max_attempts=args.max_attempts,
+    )
+    try:
+        with instrumentation.span("client"):
+            client = get_client(credentials, scheduler, args.page_size, args.prefetch_pages)
+    except Exception as e:
+        logging.error(f"Could not create the Monitoring client: {e}")
+        sys.exit(1)
 
     metrics_with_data = []
     metrics_without_data = []
+    # Metric name -> the error that stopped it (a MetricQueryError, or a chart failure).
+    metrics_failed = {}
 
-    if args.generate_report_charts:
+    if args.watch:
+        from .watch import MetricWatcher, run, serve
+
+        if cache is not None:
+            logging.info("--watch keeps its window in memory; the cache is not used.")
+        metric_names = list(METRIC_CONFIGS.keys()) if args.all_metrics else [args.metric]
+        watcher = MetricWatcher(
+            project_ids=project_ids,
+            metric_configs=[METRIC_CONFIGS[name] for name in metric_names],
+            client=client,
+            window_days=args.days_ago_start,
+            alignment_period_s=alignment_period_s,
+            max_concurrency=args.max_concurrency,
+            group_by=group_by,
+            filters=filters,
+        )
+        server = serve(watcher, args.watch_host, args.watch_port)
+        # Exit cleanly when a service manager stops the daemon.
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            run(watcher, args.watch)
+        except KeyboardInterrupt:
+            logging.info("Watch stopped.")
+        finally:
+            server.shutdown()
+        return
+    elif args.stream:
+        if cache is not None:
+            logging.info("--stream reads directly from the API; the cache is not used.")
+        metric_names = list(METRIC_CONFIGS.keys()) if args.all_metrics else [args.metric]
+        for metric_name in metric_names:
+            metric_config = METRIC_CONFIGS[metric_name]
+            if args.all_metrics and not args.output_file:
+                print(f"\n--- Metric: {metric_name} ---", flush=True)
+            pages = (
+                page
+                for project_id in project_ids
+                for page in iter_metric_pages(
+                    project_id=project_id,
+                    metric_config=metric_config,
+                    days_ago_start=args.days_ago_start,
+                    days_ago_end=args.days_ago_end,
+                    client=client,
+                    alignment_period_s=alignment_period_s,
+                    group_by=group_by,
+                    filters=filters,
+                )
+            )
+            path = output_path(args.output_file, metric_name)
+            try:
+                with open(path, "w") if path else contextlib.nullcontext(sys.stdout) as out:
+                    has_data = stream_data(pages, stream_columns(metric_config, group_by), args.output, out, metric_name)
+            except MetricQueryError as e:
+                metrics_failed[metric_name] = e
+                continue
+            if has_data:
+                metrics_with_data.append(metric_name)
+            else:
+                metrics_without_data.append(metric_name)
+    elif args.generate_report_charts:
         generate_report_charts(
-            project_id=args.project_id,
+            project_ids=project_ids,
             days_ago_start=args.days_ago_start,
             days_ago_end=args.days_ago_end,
             filter_model_id=args.filter_model_id,
             metrics_with_data=metrics_with_data,
-            metrics_without_data=metrics_without_data
+            metrics_without_data=metrics_without_data,
+            max_concurrency=args.max_concurrency,
+            cache=cache,
+            resolution=args.resolution,
+            percentiles=args.percentiles,
+            filters=filters,
+            client=client,
+            coalesce=not args.no_coalesce,
+            errors=metrics_failed,
+            top_n=args.top_n,
+            checkpoint=checkpoint,
+        )
+    elif args.wide:
+        wide = query_wide(
+            project_id=project_ids,
+            metric_configs=[METRIC_CONFIGS[name] for name in args.wide],
+            days_ago_start=args.days_ago_start,
+            days_ago_end=args.days_ago_end,
+            max_concurrency=args.max_concurrency,
+            client=client,
+            cache=cache,
+            alignment_period_s=alignment_period_s,
+            filters=filters,
+            coalesce=not args.no_coalesce,
+            errors=metrics_failed,
+            checkpoint=checkpoint,
         )
+        for metric_name in args.wide:
+            if metric_name in metrics_failed:
+                continue
+            value_name = METRIC_CONFIGS[metric_name].value_name
+            if value_name in wide.columns and wide[value_name].notna().any():
+                metrics_with_data.append(metric_name)
+            else:
+                metrics_without_data.append(metric_name)
+        print_data(wide.reset_index(), args.output, "wide", output_path(args.output_file, "wide"))
     elif args.all_metrics:
-        for metric_name, metric_config in METRIC_CONFIGS.items():
-            logging.info(f"--- Querying Metric: {metric_name} ---")
-            usage_data = query_metric(
-                project_id=args.project_id,
-                metric_config=metric_config,
-                days_ago_start=args.days_ago_start,
-                days_ago_end=args.days_ago_end,
-            )
-            
+        results = query_metrics(
+            project_id=project_ids,
+            metric_configs=list(METRIC_CONFIGS.values()),
+            days_ago_start=args.days_ago_start,
+            days_ago_end=args.days_ago_end,
+            max_concurrency=args.max_concurrency,
+            cache=cache,
+            alignment_period_s=alignment_period_s,
+            histogram=bool(args.percentiles),
+            group_by={name: group_by for name in METRIC_CONFIGS} if group_by is not None else None,
+            filters=filters,
+            client=client,
+            coalesce=not args.no_coalesce,
+            errors=metrics_failed,
+            checkpoint=checkpoint,
+        )
+        if rollups is not None:
+            refresh_rollups(rollups, results, project_ids, args.days_ago_start, args.days_ago_end, metrics_failed)
+        for metric_name, usage_data in results.items():
+            logging.info(f"--- Metric: {metric_name} ---")
             if not usage_data.empty:
                 metrics_with_data.append(metric_name)
-                print(f"\n--- Metric: {metric_name} ---")
-                print_data(usage_data, args.output)
-            else:
+                if not args.output_file:
+                    print(f"\n--- Metric: {metric_name} ---")
+                if args.percentiles:
+                    usage_data = summarize(usage_data, METRIC_CONFIGS[metric_name].value_name, args.percentiles)
+                print_data(usage_data, args.output, metric_name, output_path(args.output_file, metric_name))
+            elif metric_name not in metrics_failed:
                 metrics_without_data.append(metric_name)
             
             logging.info(f"--- End of Metric: {metric_name} ---")
     elif args.metric:
         metric_config = METRIC_CONFIGS[args.metric]
-        usage_data = query_metric(
-            project_id=args.project_id,
-            metric_config=metric_config,
+        usage_data = query_metrics(
+            project_id=project_ids,
+            metric_configs=[metric_config],
             days_ago_start=args.days_ago_start,
             days_ago_end=args.days_ago_end,
-        )
+            max_concurrency=args.max_concurrency,
+            client=client,
+            cache=cache,
+            alignment_period_s=alignment_period_s,
+            histogram=bool(args.percentiles),
+            group_by={args.metric: group_by} if group_by is not None else None,
+            filters=filters,
+            errors=metrics_failed,
+            checkpoint=checkpoint,
+        )[args.metric]
+        if rollups is not None:
+            refresh_rollups(rollups, {args.metric: usage_data}, project_ids, args.days_ago_start, args.days_ago_end, metrics_failed)
         
         if not usage_data.empty:
             metrics_with_data.append(args.metric)
-            print_data(usage_data, args.output)
-        else:
+            if args.percentiles:
+                print_data(summarize(usage_data, metric_config.value_name, args.percentiles), args.output, args.metric, output_path(args.output_file, args.metric))
+            else:
+                print_data(usage_data, args.output, args.metric, output_path(args.output_file, args.metric))
+        elif args.metric not in metrics_failed:
             metrics_without_data.append(args.metric)
 
         if args.generate_graph:
+            from .charting import render_metric_chart
             group_by_cols = args.graph_group_by.split(',') if args.graph_group_by else []
-            generate_chart(usage_data, metric_config.name, metric_config.value_name, group_by_cols)
-
-    # --- Final Summary ---
-    if len(metrics_with_data) + len(metrics_without_data) > 1:
-        logging.info("\n\n--- Query Summary ---")
-        if metrics_with_data:
-            logging.info("Metrics with data found:")
-            for metric in sorted(metrics_with_data):
-                logging.info(f"  - {metric}")
-        if metrics_without_data:
-            logging.info("Metrics with no data:")
-            for metric in sorted(metrics_without_data):
-                logging.info(f"  - {metric}")
-        logging.info("--- End of Summary ---")
+            render_metric_chart(usage_data, metric_config, group_by_cols, period_label(args.resolution), args.percentiles, args.top_n)
+
+    log_summary(metrics_with_data, metrics_without_data, metrics_failed)
+    if metrics_failed:
+        # A failed query is not "no data": tell the caller the output is incomplete.
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,218 @@
+import contextlib
+import datetime
+import logging
+import os
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from .config.models import MetricConfig
+from .config.query import PREFERRED_ORDER, RESOURCE_LABELS
+
+GRAINS = ["day", "week", "month"]
+
+# SQL expression for the start of the week (Monday) or month containing `period`.
+_PERIOD_START = {
+    "day": "period",
+    "week": "date(period, '-6 days', 'weekday 1')",
+    "month": "strftime('%Y-%m-01', period)",
+}
+
+# How values are combined over time (by aligner) and over labels (by reducer).
+_TIME_AGGREGATES = {"ALIGN_DELTA": "SUM", "ALIGN_SUM": "SUM", "ALIGN_MEAN": "AVG", "ALIGN_MAX": "MAX", "ALIGN_MIN": "MIN"}
+_LABEL_AGGREGATES = {"REDUCE_SUM": "SUM", "REDUCE_MEAN": "AVG", "REDUCE_MAX": "MAX", "REDUCE_MIN": "MIN"}
+
+def rollup_labels(metric_config: MetricConfig) -> List[str]:
+    """
+    Returns the label dimensions a metric's rollups are kept over: every resource
+    label and every configured metric label.
+    """
+    return RESOURCE_LABELS + [label for label in metric_config.metric_labels if label not in RESOURCE_LABELS]
+
+def window_days(days_ago_start: int, days_ago_end: int) -> Tuple[datetime.date, datetime.date]:
+    """
+    Returns the first and last UTC day of a --days-ago-start/--days-ago-end window.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return (now - datetime.timedelta(days=days_ago_start)).date(), (now - datetime.timedelta(days=days_ago_end)).date()
+
+def _week_start(day: datetime.date) -> datetime.date:
+    return day - datetime.timedelta(days=day.weekday())
+
+def _month_start(day: datetime.date) -> datetime.date:
+    return day.replace(day=1)
+
+class RollupStore:
+    """
+    A local SQLite store of pre-aggregated metric rows, answering group-by and filter
+    queries without calling the API.
+
+    Each metric has its own table with one column per label dimension (see
+    rollup_labels) and one row per grain (day, week or month), period start and
+    label set. Day rows are the fetched daily rows at full label detail; week and
+    month rows are rebuilt from them with the metric's time aggregate whenever the
+    days they cover change. A query reduces over the labels it does not group by
+    with the metric's reducer.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.path = os.path.join(self.cache_dir, "rollups.sqlite")
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # A fresh connection per call, as in MetricCache.
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _table(metric_config: MetricConfig) -> str:
+        return f'"rollup_{metric_config.name}"'
+
+    def _ensure_table(self, conn: sqlite3.Connection, metric_config: MetricConfig):
+        """
+        Creates the metric's table and indexes, replacing a table whose label columns
+        no longer match the metric config.
+        """
+        table = self._table(metric_config)
+        labels = rollup_labels(metric_config)
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        if columns and columns != ["grain", "period"] + labels + ["value"]:
+            logging.info(f"The labels of {metric_config.name} changed; rebuilding its rollups.")
+            conn.execute(f"DROP TABLE {table}")
+        label_columns = "".join(f'"{label}" TEXT NOT NULL, ' for label in labels)
+        key = ", ".join(["grain", "period"] + [f'"{label}"' for label in labels])
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (grain TEXT NOT NULL, period TEXT NOT NULL, "
+            f"{label_columns}value NUMERIC, PRIMARY KEY ({key}))"
+        )
+        # The primary key serves time range scans; one index per label serves filters.
+        for label in labels:
+            conn.execute(
+                f'CREATE INDEX IF NOT EXISTS "rollup_{metric_config.name}_{label}" '
+                f'ON {table} ("{label}", grain, period)'
+            )
+
+    def refresh(
+        self,
+        metric_config: MetricConfig,
+        df: pd.DataFrame,
+        project_ids: Iterable[str],
+        first_day: datetime.date,
+        last_day: datetime.date,
+    ):
+        """
+        Replaces the day rows of `project_ids` from `first_day` to `last_day` with the
+        rows of `df` (daily rows at full label detail, dated by UTC day), and rebuilds
+        the week and month rows that cover those days.
+        """
+        table = self._table(metric_config)
+        labels = rollup_labels(metric_config)
+        project_ids = list(project_ids)
+        records = []
+        if not df.empty:
+            # Missing labels are stored as empty strings so they take part in the primary key.
+            rows = df.reindex(columns=labels).astype(object).fillna("")
+            rows.insert(0, "period", pd.to_datetime(df["date"]).dt.strftime("%Y-%m-%d"))
+            rows["value"] = df[metric_config.value_name].tolist()
+            records = [("day",) + record for record in rows.itertuples(index=False, name=None)]
+
+        placeholders = ",".join("?" for _ in project_ids)
+        with self._connect() as conn:
+            self._ensure_table(conn, metric_config)
+            conn.execute(
+                f"DELETE FROM {table} WHERE grain = 'day' AND period BETWEEN ? AND ? AND project_id IN ({placeholders})",
+                [first_day.isoformat(), last_day.isoformat()] + project_ids,
+            )
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {table} VALUES ({','.join('?' for _ in range(len(labels) + 3))})",
+                records,
+            )
+            self._rebuild(conn, metric_config, "week", _week_start(first_day), _week_start(last_day) + datetime.timedelta(days=6))
+            next_month = (_month_start(last_day) + datetime.timedelta(days=31)).replace(day=1)
+            self._rebuild(conn, metric_config, "month", _month_start(first_day), next_month - datetime.timedelta(days=1))
+
+    def _rebuild(self, conn: sqlite3.Connection, metric_config: MetricConfig, grain: str, first_day: datetime.date, last_day: datetime.date):
+        """
+        Recomputes the `grain` rows of the periods from `first_day` to `last_day` (both
+        period boundaries) from the day rows.
+        """
+        table = self._table(metric_config)
+        label_columns = ", ".join(f'"{label}"' for label in rollup_labels(metric_config))
+        aggregate = _TIME_AGGREGATES.get(metric_config.aligner, "SUM")
+        bounds = [first_day.isoformat(), last_day.isoformat()]
+        conn.execute(f"DELETE FROM {table} WHERE grain = ? AND period BETWEEN ? AND ?", [grain] + bounds)
+        conn.execute(
+            f"INSERT INTO {table} SELECT ?, {_PERIOD_START[grain]} AS start, {label_columns}, {aggregate}(value) "
+            f"FROM {table} WHERE grain = 'day' AND period BETWEEN ? AND ? GROUP BY start, {label_columns}",
+            [grain] + bounds,
+        )
+
+    def query(
+        self,
+        metric_config: MetricConfig,
+        project_ids: Iterable[str],
+        first_day: datetime.date,
+        last_day: datetime.date,
+        grain: str = "day",
+        group_by: Optional[List[str]] = None,
+        filters: Optional[Dict[str, str]] = None,
+    ) -> pd.DataFrame:
+        """
+        Returns one row per `grain` period overlapping `first_day`..`last_day` and label
+        set, in the column layout of query_metric: `date` (the period start), the
+        labels, then the value. With `group_by`, only those labels (plus project_id)
+        are kept. Filters on labels the metric does not have are ignored, as in the
+        API path. An empty DataFrame means no rows are stored for the query.
+        """
+        labels = rollup_labels(metric_config)
+        kept = [label for label in labels if group_by is None or label == "project_id" or label in group_by]
+        # Columns in the display order of query_metric: preferred labels first, then the rest sorted.
+        kept = [label for label in PREFERRED_ORDER if label in kept] + sorted(
+            label for label in kept if label not in PREFERRED_ORDER
+        )
+        project_ids = list(project_ids)
+        clauses = ["grain = ?", "period BETWEEN ? AND ?", f"project_id IN ({','.join('?' for _ in project_ids)})"]
+        start = {"day": first_day, "week": _week_start(first_day), "month": _month_start(first_day)}[grain]
+        params = [grain, start.isoformat(), last_day.isoformat()] + project_ids
+        for label, value in (filters or {}).items():
+            if label in labels:
+                clauses.append(f'"{label}" = ?')
+                params.append(value)
+
+        select = ", ".join(f'"{label}"' for label in kept)
+        aggregate = _LABEL_AGGREGATES.get(metric_config.reducer, "SUM")
+        with self._connect() as conn:
+            self._ensure_table(conn, metric_config)
+            rows = conn.execute(
+                f"SELECT period, {select}, {aggregate}(value) FROM {self._table(metric_config)} "
+                f"WHERE {' AND '.join(clauses)} GROUP BY period, {select} ORDER BY period, {select}",
+                params,
+            ).fetchall()
+        if not rows:
+            return pd.DataFrame()
+
+        df = pd.DataFrame(rows, columns=["date"] + kept + [metric_config.value_name])
+        df["date"] = pd.to_datetime(df["date"]).dt.date
+        df[kept] = df[kept].replace({"": None})
+        return df
+
+    def invalidate(self, project_id: str) -> int:
+        """
+        Deletes every rollup row of a project. Returns the number of deleted rows.
+        """
+        deleted = 0
+        with self._connect() as conn:
+            tables = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'rollup_%'").fetchall()
+            for (table,) in tables:
+                deleted += conn.execute(f'DELETE FROM "{table}" WHERE project_id = ?', (project_id,)).rowcount
+        logging.info(f"Removed {deleted} rollup row(s) from {self.path}.")
+        return deleted
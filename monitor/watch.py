@@ -0,0 +1,233 @@
+import concurrent.futures
+import datetime
+import http.server
+import json
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from .config.models import MetricConfig
+from .config.query import ONE_DAY_S
+from .gcp_client import _floor_time, fetch_metric_since
+from .histograms import is_histogram_column
+from . import instrumentation
+
+class MetricWatcher:
+    """
+    Keeps a rolling window of every watched metric in memory and refreshes it
+    incrementally.
+
+    Each metric has a watermark: the start of the newest period it has fetched,
+    which may still have been open. A poll re-fetches only from the watermark
+    until now, replaces the rows of those periods and drops the rows that have
+    left the window. All points lie on the UTC-aligned grid of
+    gcp_client.fetch_metric_since, so a period keeps the same label across polls.
+    A failed poll keeps the previous data and watermark, and the next poll
+    retries.
+    """
+
+    def __init__(
+        self,
+        project_ids: List[str],
+        metric_configs: List[MetricConfig],
+        client,
+        window_days: int = 90,
+        alignment_period_s: int = ONE_DAY_S,
+        max_concurrency: int = 1,
+        group_by: Optional[List[str]] = None,
+        filters: Optional[Dict[str, str]] = None,
+    ):
+        self.project_ids = project_ids
+        self.metric_configs = metric_configs
+        self.client = client
+        self.window = datetime.timedelta(days=window_days)
+        self.alignment_period_s = alignment_period_s
+        self.max_concurrency = max_concurrency
+        self.group_by = group_by
+        self.filters = filters
+        self.frames: Dict[str, pd.DataFrame] = {}
+        self.watermarks: Dict[str, datetime.datetime] = {}
+        self.last_success: Dict[str, datetime.datetime] = {}
+        self.poll_errors: Dict[str, int] = {config.name: 0 for config in metric_configs}
+        self._lock = threading.Lock()
+        self._aggregates: Dict[str, pd.DataFrame] = {}
+
+    def poll(self, now: Optional[datetime.datetime] = None) -> int:
+        """
+        Refreshes every metric and returns the number of rows fetched.
+        """
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        fetched = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, self.max_concurrency)) as executor:
+            futures = {executor.submit(self._poll_metric, config, now): config for config in self.metric_configs}
+            for future in concurrent.futures.as_completed(futures):
+                config = futures[future]
+                try:
+                    fetched += future.result()
+                except Exception as e:
+                    self.poll_errors[config.name] += 1
+                    logging.error(f"Watch: polling {config.name} failed; keeping the previous data. Details: {e}")
+        return fetched
+
+    def _poll_metric(self, metric_config: MetricConfig, now: datetime.datetime) -> int:
+        window_start = now - self.window
+        since = self.watermarks.get(metric_config.name, window_start)
+        frames = [
+            fetch_metric_since(
+                project_id, metric_config, since, self.client, now,
+                self.alignment_period_s, group_by=self.group_by, filters=self.filters,
+            )
+            for project_id in self.project_ids
+        ]
+        new = [df for df in frames if not df.empty]
+
+        # Rows are labelled with the UTC start of their period.
+        refetched_from = pd.Timestamp(_floor_time(since, self.alignment_period_s).replace(tzinfo=None))
+        oldest_kept = pd.Timestamp(_floor_time(window_start, self.alignment_period_s).replace(tzinfo=None))
+        previous = self.frames.get(metric_config.name)
+        if previous is not None and not previous.empty:
+            periods = pd.to_datetime(previous["date"])
+            new.insert(0, previous[(periods < refetched_from) & (periods >= oldest_kept)])
+
+        df = pd.concat(new, ignore_index=True) if new else pd.DataFrame()
+        if not df.empty:
+            df = df.sort_values("date", kind="stable").reset_index(drop=True)
+        aggregates = _aggregate(df, metric_config)
+
+        with self._lock:
+            self.frames[metric_config.name] = df
+            self._aggregates[metric_config.name] = aggregates
+            self.watermarks[metric_config.name] = _floor_time(now, self.alignment_period_s)
+            self.last_success[metric_config.name] = now
+        return sum(len(frame) for frame in frames)
+
+    def prometheus(self) -> str:
+        """
+        Renders the latest aggregates in the Prometheus text exposition format.
+        """
+        prefix = instrumentation.PROMETHEUS_PREFIX
+        with self._lock:
+            aggregates = dict(self._aggregates)
+            last_success = dict(self.last_success)
+            poll_errors = dict(self.poll_errors)
+
+        lines = [
+            f"# HELP {prefix}_current_period Value of the current (possibly incomplete) period.",
+            f"# TYPE {prefix}_current_period gauge",
+        ]
+        for metric_name, df in aggregates.items():
+            for row in df.to_dict("records"):
+                current = row.pop("current_period")
+                row.pop("window_total")
+                lines.append(f"{prefix}_current_period{instrumentation.prometheus_labels(metric=metric_name, **row)} {current}")
+        lines += [
+            f"# HELP {prefix}_window_total Sum over the rolling window.",
+            f"# TYPE {prefix}_window_total gauge",
+        ]
+        for metric_name, df in aggregates.items():
+            for row in df.to_dict("records"):
+                row.pop("current_period")
+                total = row.pop("window_total")
+                lines.append(f"{prefix}_window_total{instrumentation.prometheus_labels(metric=metric_name, **row)} {total}")
+        lines += [
+            f"# HELP {prefix}_watch_last_success_timestamp_seconds Time of the last successful poll.",
+            f"# TYPE {prefix}_watch_last_success_timestamp_seconds gauge",
+        ]
+        for metric_name, moment in sorted(last_success.items()):
+            lines.append(f"{prefix}_watch_last_success_timestamp_seconds{{metric=\"{metric_name}\"}} {moment.timestamp():.0f}")
+        lines += [
+            f"# HELP {prefix}_watch_poll_errors_total Number of failed polls.",
+            f"# TYPE {prefix}_watch_poll_errors_total counter",
+        ]
+        for metric_name, errors in sorted(poll_errors.items()):
+            lines.append(f"{prefix}_watch_poll_errors_total{{metric=\"{metric_name}\"}} {errors}")
+
+        text = "\n".join(lines) + "\n"
+        if instrumentation.is_enabled():
+            text += instrumentation.to_prometheus(instrumentation.enable().snapshot())
+        return text
+
+    def summary(self) -> dict:
+        """
+        Returns the latest aggregates and the watch state of every metric as a dict.
+        """
+        with self._lock:
+            return {
+                config.name: {
+                    "watermark": _isoformat(self.watermarks.get(config.name)),
+                    "last_success": _isoformat(self.last_success.get(config.name)),
+                    "poll_errors": self.poll_errors[config.name],
+                    "rows": len(self.frames.get(config.name, ())),
+                    "aggregates": self._aggregates.get(config.name, pd.DataFrame()).to_dict("records"),
+                }
+                for config in self.metric_configs
+            }
+
+def _isoformat(moment: Optional[datetime.datetime]) -> Optional[str]:
+    return moment.isoformat() if moment else None
+
+def _aggregate(df: pd.DataFrame, metric_config: MetricConfig) -> pd.DataFrame:
+    """
+    Sums the value per label combination over the latest period and over the window.
+    """
+    value_column = metric_config.value_name
+    if df.empty:
+        return pd.DataFrame(columns=["current_period", "window_total"])
+    labels = [col for col in df.columns if col not in ("date", value_column) and not is_histogram_column(col)]
+    values = df[labels + [value_column]].astype({label: object for label in labels}).fillna({label: "" for label in labels})
+    latest = pd.to_datetime(df["date"]) == pd.to_datetime(df["date"]).max()
+    if not labels:
+        return pd.DataFrame({
+            "current_period": [values.loc[latest, value_column].sum()],
+            "window_total": [values[value_column].sum()],
+        })
+    window_total = values.groupby(labels, sort=True)[value_column].sum().rename("window_total")
+    current = values[latest].groupby(labels, sort=True)[value_column].sum().rename("current_period")
+    return pd.concat([current, window_total], axis=1).fillna(0).reset_index()
+
+def serve(watcher: MetricWatcher, host: str, port: int) -> http.server.ThreadingHTTPServer:
+    """
+    Serves the watcher's aggregates from a background thread: Prometheus text at
+    /metrics and JSON at /json.
+    """
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            if path == "/metrics":
+                body = watcher.prometheus().encode("utf-8")
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            elif path == "/json":
+                body = json.dumps(watcher.summary(), default=str).encode("utf-8")
+                content_type = "application/json"
+            else:
+                self.send_error(404, "Try /metrics or /json.")
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug(f"Watch endpoint: {format % args}")
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="watch-endpoint", daemon=True).start()
+    logging.info(f"Serving aggregates on http://{host}:{server.server_port}/metrics and /json")
+    return server
+
+def run(watcher: MetricWatcher, interval_s: int):
+    """
+    Polls every `interval_s` seconds until interrupted. Ticks are scheduled from
+    the start of the previous poll, so a slow poll does not shift the schedule.
+    """
+    while True:
+        started = time.monotonic()
+        with instrumentation.span("watch_poll"):
+            fetched = watcher.poll()
+        elapsed = time.monotonic() - started
+        logging.info(f"Watch: fetched {fetched} row(s) for {len(watcher.metric_configs)} metric(s) in {elapsed:.2f}s.")
+        time.sleep(max(0.0, interval_s - elapsed))
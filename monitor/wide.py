@@ -0,0 +1,63 @@
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from .config.metrics import UTILISATION_RATIOS
+from .config.models import MetricConfig
+
+# The labels every metric shares, and so the index of a wide frame.
+WIDE_INDEX = ["date", "project_id", "location", "model_user_id"]
+WIDE_LABELS = WIDE_INDEX[1:]
+
+def wide_column(metric_config: MetricConfig) -> str:
+    return metric_config.value_name
+
+def utilisation_column(limit_config: MetricConfig) -> str:
+    return f"{limit_config.name}_utilisation"
+
+def align_wide(
+    frames: Dict[str, pd.DataFrame],
+    metric_configs: List[MetricConfig],
+    alignment_period_s: int,
+) -> pd.DataFrame:
+    """
+    Aligns the frames of several metrics into one wide frame indexed by WIDE_INDEX,
+    with one value column per metric (NaN where a metric has no point for a key).
+
+    Each frame is reduced to one value per key with its metric's reducer (mean for
+    REDUCE_MEAN, sum otherwise), then all of them are aligned in a single outer
+    concat rather than a chain of merges. For every (usage, limit) pair of
+    UTILISATION_RATIOS that is present, a `<limit>_utilisation` column holds the
+    usage over the period divided by the limit (a per-second rate) times the
+    period length.
+    """
+    columns = {}
+    for config in metric_configs:
+        df = frames.get(config.name)
+        if df is None or df.empty:
+            continue
+        # Categorical labels have different categories in each frame; plain objects align.
+        keys = [
+            df[label].astype(object) if label in df.columns else pd.Series(None, index=df.index, dtype=object)
+            for label in WIDE_INDEX
+        ]
+        grouped = df[config.value_name].groupby(keys, dropna=False, sort=False)
+        columns[wide_column(config)] = grouped.mean() if config.reducer == "REDUCE_MEAN" else grouped.sum()
+
+    if not columns:
+        return pd.DataFrame()
+    wide = pd.concat(columns, axis=1, sort=True)
+    wide.index.names = WIDE_INDEX
+
+    configs = {config.name: config for config in metric_configs}
+    for usage_name, limit_name in UTILISATION_RATIOS:
+        usage, limit = configs.get(usage_name), configs.get(limit_name)
+        if usage is None or limit is None:
+            continue
+        if wide_column(usage) not in wide.columns or wide_column(limit) not in wide.columns:
+            continue
+        capacity = wide[wide_column(limit)] * alignment_period_s
+        # A zero or missing limit has no meaningful utilisation.
+        wide[utilisation_column(limit)] = (wide[wide_column(usage)] / capacity).replace([np.inf, -np.inf], np.nan)
+    return wide